@@ -0,0 +1,365 @@
+#Reference parity harness for the wiggle bone solvers. Run inside blender with the add-on installed
+#or next to this file:
+#
+#   blender -b -P jiggle_parity.py -- record golden.npz
+#   blender -b -P jiggle_parity.py -- compare golden.npz --engine chain --tol matrix=0.01
+#   blender -b -P jiggle_parity.py -- record colliders.npz --engine colliders
+#   blender -b -P jiggle_parity.py -- compare colliders.npz --engine instances-colliders
+#   blender -b -P jiggle_parity.py -- check
+#
+#record plays canned animations through the reference per bone solver and stores the inputs (world
+#matrices of everything animated) and outputs (per bone pose matrices, spring and velocity state) of
+#every frame. compare replays the same animations with the settings of the given engine plus any --set
+#scene settings, prints the largest deviation of every channel against its tolerance plus solver
+#throughput, and exits with 1 on failure. check runs the targeted checks of engine internals that a
+#recording can't see.
+#
+#the canned rig covers a connected chain, a disconnected bone with an animated jiggle_active toggle,
+#a bone with a CHILD_OF constraint to an animated empty, and both jiggle_reset on and off. it holds two
+#copies of the armature side by side so the thread pool and instance sharing have something to work
+#on. engines that need more of the scene (colliders, fields) add it to the rig, and their recording
+#only compares against engines building the same rig. the colliders only reach the first copy and the
+#field only the second one on part of its travel, sharing them must not carry one copy's pushes over
+#to the other.
+
+import bpy, sys, os, time, argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import wiggle_bones
+
+frame_start = 1
+frame_end = 48
+cases = {
+    'reset': {'jiggle_reset': True},
+    'continuous': {'jiggle_reset': False},
+}
+reference_settings = {'jiggle_solver': 'BONE', 'jiggle_integrator': 'EULER', 'jiggle_threads': 1,
+                      'jiggle_share_instances': False, 'jiggle_frame_budget': 0.0}
+#engine: (scene settings, rig extras)
+engines = {
+    'bone': ({}, ()),
+    'analytic': ({'jiggle_integrator': 'ANALYTIC'}, ()),
+    'chain': ({'jiggle_solver': 'CHAIN'}, ()),
+    'pool': ({'jiggle_solver': 'CHAIN', 'jiggle_threads': 2}, ()),
+    'instances': ({'jiggle_share_instances': True}, ()),
+    'budget': ({'jiggle_frame_budget': 1000.0}, ('budget',)),
+    'colliders': ({}, ('colliders',)),
+    'instances-colliders': ({'jiggle_share_instances': True}, ('colliders',)),
+    'fields': ({'jiggle_use_force_fields': True}, ('fields',)),
+    'instances-fields': ({'jiggle_use_force_fields': True, 'jiggle_share_instances': True}, ('fields',)),
+}
+channels = ('matrix', 'spring', 'velocity', 'spring2', 'velocity2')
+default_tolerance = 1e-4
+
+#every case starts from a fresh file and none of the add-on's caches of the previous one
+def build_rig(extras=()):
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    wiggle_bones.clear_jiggle_caches()
+    scene = bpy.context.scene
+    scene.frame_start = frame_start
+    scene.frame_end = frame_end
+
+    target = bpy.data.objects.new('Target', None)
+    scene.collection.objects.link(target)
+    arm = bpy.data.armatures.new('Rig')
+    ob = bpy.data.objects.new('Rig', arm)
+    scene.collection.objects.link(ob)
+    bpy.context.view_layer.objects.active = ob
+
+    bpy.ops.object.mode_set(mode='EDIT')
+    root = arm.edit_bones.new('root')
+    root.head = (0,0,0)
+    root.tail = (0,0,1)
+    parent = root
+    for i in range(4):
+        b = arm.edit_bones.new('chain.%d' %i)
+        b.head = parent.tail
+        b.tail = parent.tail + (parent.tail - parent.head).normalized() * 0.5
+        b.parent = parent
+        b.use_connect = True
+        parent = b
+    loose = arm.edit_bones.new('loose')
+    loose.head = (0.5,0,1)
+    loose.tail = (1,0,1)
+    loose.parent = root
+    held = arm.edit_bones.new('held')
+    held.head = (-0.5,0,1)
+    held.tail = (-0.5,0,1.5)
+    bpy.ops.object.mode_set(mode='POSE')
+
+    c = ob.pose.bones['held'].constraints.new('CHILD_OF')
+    c.target = target
+    for b in ob.pose.bones:
+        if b.name != 'root':
+            b.jiggle_enable = True
+
+    #animated input: armature travel, root swing, collider empty motion and an active toggle
+    for frame, x, swing in ((1, 0, 0), (12, 2, 0.6), (24, 2, -0.6), (36, 0, 0.3), (48, 0, 0)):
+        ob.location.x = x
+        ob.keyframe_insert('location', index=0, frame=frame)
+        root = ob.pose.bones['root']
+        root.rotation_mode = 'XYZ'
+        root.rotation_euler.x = swing
+        root.keyframe_insert('rotation_euler', index=0, frame=frame)
+        target.location.z = swing
+        target.keyframe_insert('location', index=2, frame=frame)
+    loose = ob.pose.bones['loose']
+    for frame, active in ((1, True), (20, False), (30, True)):
+        loose['jiggle_active'] = active #id property, the update callback needs a ui selection
+        loose.keyframe_insert('jiggle_active', frame=frame)
+
+    bpy.ops.object.mode_set(mode='OBJECT')
+    twin = ob.copy() #shares armature data and action, so its jiggle inputs match the original
+    twin.name = 'Rig.twin'
+    twin.location.y = 3 #only x is animated
+    scene.collection.objects.link(twin)
+    inputs = [target]
+    if 'colliders' in extras:
+        inputs += add_colliders(scene, (ob, twin))
+    if 'fields' in extras:
+        inputs += add_fields(scene)
+    if 'budget' in extras:
+        defer_alternate_frames(scene, twin)
+    wiggle_bones.generate_jiggle_tree()
+    return scene, (ob, twin), inputs
+
+#a ball sweeping through the chain, a floor under it and a static block beside it
+def add_colliders(scene, armatures):
+    ball = bpy.data.objects.new('Ball', None)
+    ball.empty_display_type = 'SPHERE'
+    ball.empty_display_size = 0.3
+    scene.collection.objects.link(ball)
+    for frame, x in ((1, -1), (24, 3), (48, -1)):
+        ball.location = (x, 0, 2)
+        ball.keyframe_insert('location', frame=frame)
+    colliders = [ball]
+    for name, location, kind in (('Floor', (0,0,1.2), 'SURFACE'), ('Block', (1.5,0,2), 'SDF')):
+        bpy.ops.mesh.primitive_cube_add(size=1, location=location)
+        block = bpy.context.object
+        block.name = name
+        if name == 'Floor':
+            block.scale = (6, 2, 0.1)
+        block.jiggle_collider_type = kind
+        colliders.append(block)
+    for collider in colliders:
+        collider['jiggle_collider_enable'] = True #id property, the update callback rebuilds the ui list
+    for ob in armatures:
+        for b in ob.pose.bones:
+            if b.name != 'root':
+                b['jiggle_collision'] = True
+    return colliders
+
+#a wind field next to the far end of the twin's travel, out of reach of the first copy
+def add_fields(scene):
+    wind = bpy.data.objects.new('Wind', None)
+    scene.collection.objects.link(wind)
+    wind.location = (2, 3, 1.5)
+    wind.field.type = 'FORCE'
+    wind.field.strength = 5.0
+    wind.field.use_max_distance = True
+    wind.field.distance_max = 1.0
+    return [wind]
+
+#the frame budget only degrades during playback, stand in for an over budget frame by deferring the
+#second armature on every other frame
+def defer_alternate_frames(scene, twin):
+    def schedule_frame_budget(jiggle_tree):
+        wiggle_bones.deferred_armatures.clear()
+        if scene.frame_current % 2 and twin.name in wiggle_bones.jiggle_offsets and not wiggle_bones.skip_jiggle:
+            wiggle_bones.deferred_armatures.add(twin.name)
+            wiggle_bones.deferred_frames[twin.name] = wiggle_bones.deferred_frames.get(twin.name, 0) + wiggle_bones.catchup_frames
+    wiggle_bones.schedule_frame_budget = schedule_frame_budget
+
+#play one case and collect inputs, outputs of both armatures and the time spent per frame
+def run_case(settings, extras=()):
+    original = wiggle_bones.schedule_frame_budget
+    try:
+        scene, armatures, inputs = build_rig(extras)
+        for prop, value in settings.items():
+            setattr(scene, prop, value)
+        jiggle_tree = wiggle_bones.get_jiggle_tree(scene)
+        plans = [(ob, wiggle_bones.get_jiggle_plan(ob, bone_tree)) for ob, bone_tree in wiggle_bones.jiggle_tree_objects(jiggle_tree)]
+
+        frames = list(range(frame_start, frame_end + 1)) * 2 #second pass exercises the loop boundary
+        record = {name: [] for name in channels + ('inputs',)}
+        elapsed = 0.0
+        for frame in frames:
+            t = time.perf_counter()
+            scene.frame_set(frame)
+            elapsed += time.perf_counter() - t
+            state = np.concatenate([wiggle_bones.capture_jiggle_state(ob, plan)['bones'] for ob, plan in plans])
+            record['matrix'].append([np.ravel(ob.pose.bones[name].matrix) for ob, plan in plans for name in plan['names']])
+            for i, name in enumerate(channels[1:]):
+                record[name].append(state[:,i*3:i*3+3])
+            record['inputs'].append([np.ravel(ob.matrix_world) for ob in list(armatures) + inputs])
+    finally:
+        wiggle_bones.schedule_frame_budget = original
+    record = {name: np.array(values, dtype=np.float64) for name, values in record.items()}
+    record['fps'] = np.array(len(frames) / elapsed)
+    return record
+
+def record(path, engine):
+    settings, extras = engines[engine]
+    golden = {'engine': np.array(engine), 'extras': np.array(sorted(extras), dtype=str)}
+    for case, case_settings in cases.items():
+        result = run_case({**reference_settings, **settings, **case_settings}, extras)
+        for name, values in result.items():
+            golden['%s/%s' %(case, name)] = values
+    np.savez_compressed(path, **golden)
+    print('recorded %d %s cases to %s' %(len(cases), engine, path))
+
+def compare(path, engine, settings, tolerances):
+    golden = np.load(path)
+    engine_settings, extras = engines[engine]
+    if sorted(extras) != list(golden['extras']):
+        print('%s builds a different rig than the %s recording, record one with matching extras' %(engine, golden['engine']))
+        return False
+    failed = False
+    for case, case_settings in cases.items():
+        result = run_case({**reference_settings, **engine_settings, **case_settings, **settings}, extras)
+        if not np.allclose(result['inputs'], golden['%s/inputs' %case]):
+            print('%s: animation inputs differ from the recording, rerun record' %case)
+            failed = True
+            continue
+        for name in channels:
+            reference = golden['%s/%s' %(case, name)]
+            if reference.shape != result[name].shape:
+                print('%-10s %-9s shape %s != %s  FAIL' %(case, name, result[name].shape, reference.shape))
+                failed = True
+                continue
+            error = np.abs(result[name] - reference).max() if reference.size else 0.0
+            tolerance = tolerances.get(name, default_tolerance)
+            ok = error <= tolerance
+            failed = failed or not ok
+            print('%-10s %-9s max error %.3e tolerance %.1e  %s' %(case, name, error, tolerance, 'ok' if ok else 'FAIL'))
+        fps = float(result['fps'])
+        reference_fps = float(golden['%s/fps' %case])
+        print('%-10s throughput %.1f frames/s, reference %.1f (%.2fx)' %(case, fps, reference_fps, fps / reference_fps))
+    return not failed
+
+######## CHECKS ########
+#each check builds its own rig and returns whether it holds
+
+#a deferred armature reapplies the local jiggle offsets of its last solve over the animated pose. with
+#the solve standing in as basis @ offset, the next frame's deferred pose has to be its basis @ offset
+def check_deferred_offsets():
+    from mathutils import Matrix
+    scene, (ob, twin), inputs = build_rig()
+    chain = ob.pose.bones['chain.1']
+    for frame, angle in ((1, 0.0), (20, 1.2)):
+        chain.rotation_quaternion = Matrix.Rotation(angle, 4, 'Z').to_quaternion()
+        chain.keyframe_insert('rotation_quaternion', frame=frame)
+    scene.jiggle_enable = False #animation only, the offsets are applied by hand
+    plan = wiggle_bones.jiggle_armature_plan(scene, ob)
+    offset = Matrix.Translation((0, 0.1, 0.05)) @ Matrix.Rotation(0.4, 4, 'X')
+
+    scene.frame_set(10)
+    basis = wiggle_bones.pose_bone_array(ob, 'matrix_basis', 16)[plan['indices']]
+    for name in plan['names']:
+        b = ob.pose.bones[name]
+        b.matrix_basis = b.matrix_basis @ offset
+    wiggle_bones.store_jiggle_offsets(ob, plan, basis)
+    scene.frame_set(11)
+    expected = [ob.pose.bones[name].matrix_basis @ offset for name in plan['names']]
+    wiggle_bones.apply_jiggle_offsets(ob, plan)
+    error = max(np.abs(np.array(ob.pose.bones[name].matrix_basis) - np.array(m)).max() for name, m in zip(plan['names'], expected))
+    print('deferred offsets max error %.3e' %error)
+    return error < 1e-5
+
+#the twin follows the rig until a nudge makes its motion differ for one frame. from then on it has to
+#solve alone, capturing a follower's state for a checkpoint must not end its sharing
+def check_instance_divergence():
+    scene, (ob, twin), inputs = build_rig()
+    scene.jiggle_share_instances = True
+    scene.jiggle_reset = True #groups form on the reset frame
+    followed = False
+    for frame in range(frame_start, 11):
+        scene.frame_set(frame)
+        followed = followed or twin.name in wiggle_bones.instance_leaders
+    wiggle_bones.capture_jiggle_state(twin, wiggle_bones.jiggle_armature_plan(scene, twin))
+    captured = twin.name in wiggle_bones.instance_leaders
+    twin.delta_location.y = 0.5
+    scene.frame_set(11)
+    twin.delta_location.y = 0.0
+    rejoined = []
+    for frame in range(12, frame_end + 1):
+        scene.frame_set(frame)
+        if twin.name in wiggle_bones.instance_leaders:
+            rejoined.append(frame)
+    print('instance divergence followed %s, kept after capture %s, rejoined on frames %s' %(followed, captured, rejoined))
+    return followed and captured and not rejoined
+
+#the twin follows the rig until its travel takes it into the field. a follower would be handed the
+#rig's unpushed state, so from then on it has to solve alone
+def check_instance_fields():
+    scene, (ob, twin), inputs = build_rig(('fields',))
+    scene.jiggle_use_force_fields = True
+    scene.jiggle_share_instances = True
+    scene.jiggle_reset = True
+    followed, pushed = [], []
+    for frame in range(frame_start, frame_end + 1):
+        scene.frame_set(frame)
+        if twin.name in wiggle_bones.instance_leaders:
+            followed.append(frame)
+        if twin.name in wiggle_bones.field_forces:
+            pushed.append(frame)
+    print('instance fields followed on frames %s, pushed on frames %s' %(followed, pushed))
+    return bool(followed and pushed) and not set(followed) & set(pushed) and max(followed) < min(pushed)
+
+checks = {
+    'deferred_offsets': check_deferred_offsets,
+    'instance_divergence': check_instance_divergence,
+    'instance_fields': check_instance_fields,
+}
+
+def check():
+    failed = False
+    for name, run in checks.items():
+        ok = run()
+        failed = failed or not ok
+        print('%-20s %s' %(name, 'ok' if ok else 'FAIL'))
+    return not failed
+
+def parse_pairs(pairs, convert):
+    values = {}
+    for pair in pairs:
+        key, value = pair.split('=', 1)
+        values[key] = convert(value)
+    return values
+
+#scene settings given on the command line keep the type of the property they set
+def setting_value(value):
+    for convert in (int, float):
+        try:
+            return convert(value)
+        except ValueError:
+            pass
+    if value in ('True', 'False'):
+        return value == 'True'
+    return value
+
+def main():
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    parser = argparse.ArgumentParser(prog='jiggle_parity.py')
+    parser.add_argument('mode', choices=('record', 'compare', 'check'))
+    parser.add_argument('path', nargs='?')
+    parser.add_argument('--engine', choices=sorted(engines), default='bone', help='solver and engine settings to run')
+    parser.add_argument('--set', nargs='*', default=[], help='further scene settings, e.g. jiggle_chain_substeps=2')
+    parser.add_argument('--tol', nargs='*', default=[], help='per channel tolerances, e.g. matrix=0.01')
+    args = parser.parse_args(argv)
+
+    if not hasattr(bpy.types.Scene, 'jiggle_solver'):
+        wiggle_bones.register()
+    if args.mode != 'check' and not args.path:
+        parser.error('%s needs a recording path' %args.mode)
+    if args.mode == 'record':
+        record(args.path, args.engine)
+    elif args.mode == 'check':
+        if not check():
+            sys.exit(1)
+    elif not compare(args.path, args.engine, parse_pairs(args.set, setting_value), parse_pairs(args.tol, float)):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,7 @@
 bl_info = {
     "name": "Wiggle Bone",
     "author": "Steve Miller",
-    "version": (1, 5, 0),
+    "version": (1, 6, 0),
     "blender": (2, 80, 0),
     "location": "Properties > Bone",
     "description": "Simulates simple jiggle physics on bones",
@@ -12,14 +12,54 @@ bl_info = {
 
 import bpy, math, mathutils
 from mathutils import Vector,Matrix,Euler,Quaternion
+from mathutils.bvhtree import BVHTree
 from bpy.app.handlers import persistent
 import json
+import zlib
+import struct
+import os
+import time
+import itertools
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
 
 skip = False 
 render = False
-curframe = None
+curframes = {} #last jiggled frame per scene
+solved_frames = {} #frame per scene whose solve is still valid for further depsgraph evaluations
+jiggle_results = {} #per armature pose of the last solve, see store_jiggle_result
+jiggle_checkpoints = OrderedDict() #(scene, frame) state snapshots in least recently used order
+moved_objects = set() #objects the depsgraph reported as transformed or edited since their last solve
+animated_armatures = {} #per armature whether any of its animation actually changes values
+idle_armatures = set() #armatures the current frame skips, decided in the pre pass
+watch_state = {} #per armature watched objects and their world matrices, settledness and reach of its last solve
+eval_scene = None
 skip_jiggle = False
+catchup_frames = 1 #frames the next solve covers, more than one when playback dropped frames
 skip_handler = False
+jiggle_plans = {} #per armature flat arrays of the jiggle bone tree, see build_jiggle_plan
+jiggle_trees = {} #per scene jiggle_tree converted from its id property, see get_jiggle_tree
+topology_version = 1
+chain_state = {} #per armature particle state of the chain solver
+instance_history = {} #per armature fingerprint of its jiggle inputs since the last reset
+instance_leaders = {} #armatures sharing the solve of an identical one, name: (leader name, world offset)
+chain_pool = None #worker threads of the chain solver, see dispatch_chain_solves
+chain_pool_threads = 0
+chain_jobs = {} #per armature future of its timed_chain_step this frame, run on chain_pool or already done
+solve_costs = {} #per armature moving average of its full quality solve time in seconds
+deferred_armatures = set() #armatures reusing their last jiggle this frame to stay in the frame budget
+deferred_frames = {} #per armature frames not solved since its last solve
+jiggle_offsets = {} #per armature local jiggle offsets of its last solve, reapplied while deferred
+budget_substeps = 0 #chain substeps while over the frame budget, 0 uses the scene's
+field_forces = {} #per armature world force of the scene's force fields at each plan bone's tail this frame
+field_lattices = {} #per seed periodic noise lattice sampled by turbulence fields
+field_objects = {} #per scene its object count and the names of its force field objects, see scene_fields
+jiggle_colliders = [] #colliders of the frame being solved, see update_colliders
+collider_cache = {} #per mesh collider its object space bvh tree and bounds, reused until its geometry changes
+sdf_grids = {} #per static mesh collider its signed distance grid, see load_sdf
+param_tables = {} #per armature jiggle parameters over a bake or cache fill range, see prefetch_jiggle_params
+seed_states = {} #armatures the next evaluation reseeds, name: state snapshot or None for the current pose
 
 ######## NEW STUFF STARTS ############################################
 #Consider replacing generic python object with an actual node that doesn't need to be converted to dict on each access:
@@ -31,30 +71,30 @@ skip_handler = False
 
 
 def find_parent(item, nodes):
-    if item.parent:
-        if item.parent.name in nodes:
-            return item.parent
-        else:
-            return find_parent(item.parent, nodes)
-    else:
-        return None 
+    item = item.parent
+    while item and item.name not in nodes:
+        item = item.parent
+    return item
                             
+#one pass over the pose bones collects the hierarchy, a depth first walk of it then hangs every
+#jiggle bone under its nearest jiggle ancestor. linear in the bone count at any chain depth
 def generate_jiggle_tree_bones(ob):
     print('GENERATING BONES FOR: ' + ob.name)
-    nodes = {}
-    
+    children = {}
     for b in ob.pose.bones:
-        if b.jiggle_enable:
-            nodes[b.name] = {'children':{}, 'type':'BONE'}
-            b['jiggle_mat']=b.id_data.matrix_world @ b.matrix
+        children.setdefault(b.parent.name if b.parent else None, []).append(b)
+    
     tree = {}
-    for bone_node in nodes:
-        parent = find_parent(ob.pose.bones[bone_node],nodes)
-        if parent:
-            nodes[parent.name]['children'][bone_node] = nodes[bone_node]
-        else:
-            tree[bone_node] = nodes[bone_node]
+    stack = [(b, tree) for b in reversed(children.get(None, []))]
+    while stack:
+        b, siblings = stack.pop()
+        if b.jiggle_enable:
+            node = siblings[b.name] = {'children':{}, 'type':'BONE'}
+            b.jiggle_last_mat=b.id_data.matrix_world @ b.matrix
+            siblings = node['children']
+        stack.extend((child, siblings) for child in reversed(children.get(b.name, [])))
     #print(tree)
+    build_jiggle_plan(ob, tree)
     return tree
 
 def generate_jiggle_tree():             
@@ -62,8 +102,17 @@ def generate_jiggle_tree():
     print('REFRESH JIGGLE LIST')
     
     nodes = {}
+    jiggle_plans.clear()
+    param_tables.clear()
+    jiggle_checkpoints.clear()
+    animated_armatures.clear()
+    watch_state.clear()
+    instance_history.clear()
+    instance_leaders.clear()
+    jiggle_offsets.clear()
+    deferred_frames.clear()
     #iterate through objects
-    for ob in bpy.context.scene.objects:
+    for ob in jiggle_scene().objects:
         if ob.type == 'ARMATURE' and ob.data.jiggle_enable:
             nodes[ob.name] = {'children':{},'type':'OBJECT','bones':generate_jiggle_tree_bones(ob)}
     #print(nodes)
@@ -76,7 +125,167 @@ def generate_jiggle_tree():
         else:
             tree[ob_node] =nodes[ob_node]
             
-    bpy.context.scene['jiggle_tree'] = tree #json.dumps(tree)
+    jiggle_scene()['jiggle_tree'] = tree #json.dumps(tree)
+    jiggle_trees[jiggle_scene().name] = tree
+
+#the scene's jiggle tree without converting the id property on every access
+def get_jiggle_tree(scene):
+    tree = jiggle_trees.get(scene.name)
+    if tree is None:
+        tree = jiggle_trees[scene.name] = scene['jiggle_tree'].to_dict()
+    return tree
+    
+#flatten an armature's jiggle bone tree into parent-first arrays for the array based solvers
+def build_jiggle_plan(ob, bone_tree):
+    names = []
+    parents = []
+    stack = [(item, node, -1) for item, node in reversed(list(bone_tree.items()))]
+    while stack:
+        item, node, parent = stack.pop()
+        names.append(item)
+        parents.append(parent)
+        stack.extend((child, sub, len(names) - 1) for child, sub in reversed(list(node['children'].items())))
+    plan = compile_jiggle_plan(ob, names, parents)
+    store_jiggle_topology(ob, plan)
+    return plan
+
+def compile_jiggle_plan(ob, names, parents):
+    depth = [0]*len(names)
+    for i, p in enumerate(parents):
+        if p >= 0:
+            depth[i] = depth[p] + 1
+    depth = np.array(depth, dtype=np.int32)
+    
+    plan = {
+        'pose': ob.pose.as_pointer(),
+        'count': len(ob.pose.bones),
+        'checksum': bone_names_checksum(ob),
+        'names': names,
+        'parents': np.array(parents, dtype=np.int32),
+        'indices': np.array([ob.pose.bones.find(name) for name in names], dtype=np.int32),
+        'levels': [np.flatnonzero(depth == d) for d in range(depth.max() + 1)] if names else [],
+        'ends': subtree_ends(parents),
+        'dynamic': dynamic_offset_bones(ob, names, parents),
+        'offsets': {},
+        'rest': jiggle_rest_arrays(ob, [name for name in names if name in ob.pose.bones]),
+    }
+    jiggle_plans[ob.name] = plan
+    return plan
+
+#names are parent first and depth first, so every subtree is a contiguous run: ends[i] is one past
+#the last descendant of bone i
+def subtree_ends(parents):
+    ends = np.arange(1, len(parents) + 1, dtype=np.int32)
+    for i in range(len(parents) - 1, -1, -1):
+        if parents[i] >= 0:
+            ends[parents[i]] = max(ends[parents[i]], ends[i])
+    return ends
+
+#bones whose offset from their jiggle parent can change over time: the bone itself or a non-jiggle
+#bone between it and its jiggle parent is animated, driven, constrained or doesn't fully inherit
+def dynamic_offset_bones(ob, names, parents):
+    animated = set()
+    ad = ob.animation_data
+    if ad:
+        fcurves = list(ad.drivers)
+        if ad.action:
+            fcurves += list(ad.action.fcurves)
+        for track in ad.nla_tracks:
+            for strip in track.strips:
+                if strip.action:
+                    fcurves += list(strip.action.fcurves)
+        for fc in fcurves:
+            if fc.data_path.startswith('pose.bones["'):
+                animated.add(fc.data_path.split('"')[1])
+    
+    dynamic = set()
+    for i, name in enumerate(names):
+        if parents[i] < 0:
+            continue
+        stop = names[parents[i]]
+        b = ob.pose.bones.get(name)
+        while b and b.name != stop:
+            if (b.name in animated or len(b.constraints) or not b.bone.use_inherit_rotation
+                or getattr(b.bone, 'inherit_scale', 'FULL') != 'FULL'):
+                dynamic.add(name)
+                break
+            b = b.parent
+    return dynamic
+
+#offset of b from its jiggle parent in the pre-jiggle pose, cached for bones where it can't change.
+#filled on the first post pass after a plan build since only then the pose is guaranteed jiggle free
+def parent_offset(ob, b, parent):
+    plan = jiggle_plans.get(ob.name)
+    if plan is None or b.name in plan['dynamic']:
+        return (b.matrix.inverted() @ parent.matrix).inverted()
+    diff_mat = plan['offsets'].get(b.name)
+    if diff_mat is None:
+        diff_mat = plan['offsets'][b.name] = (b.matrix.inverted() @ parent.matrix).inverted()
+    return diff_mat
+
+#keys, constraints or inherit settings added after a plan was compiled change which bones have a
+#fixed offset from their jiggle parent, so the cached offsets are dropped and recollected
+def refresh_parent_offsets(ob):
+    plan = jiggle_plans.get(ob.name)
+    if plan is None:
+        return
+    if not plan_valid(ob, plan):
+        jiggle_plans.pop(ob.name)
+        return
+    plan['dynamic'] = dynamic_offset_bones(ob, plan['names'], plan['parents'])
+    plan['offsets'].clear()
+
+#plans index pose bones by position. the pose pointer survives bone edits, so the pre pass checks
+#every frame that no bone was added, removed or renamed since the plan was compiled
+def bone_names_checksum(ob):
+    return zlib.crc32('\0'.join(b.name for b in ob.pose.bones).encode())
+
+def plan_valid(ob, plan):
+    return plan['count'] == len(ob.pose.bones) and plan['checksum'] == bone_names_checksum(ob)
+
+#plans don't survive file loads, the pose pointer catches those
+def get_jiggle_plan(ob, bone_tree):
+    plan = jiggle_plans.get(ob.name)
+    if plan is None or plan['pose'] != ob.pose.as_pointer():
+        plan = load_jiggle_plan(ob) or build_jiggle_plan(ob, bone_tree)
+    return plan
+
+#compact topology record kept on the armature datablock so plans can be compiled after a file
+#load without walking the scene or the bone hierarchy. bones are pose bone indices, parents are
+#indices into bones (-1 for roots), checksums cover all bone names and the jiggle_enable flags.
+def armature_checksums(ob):
+    names = bone_names_checksum(ob)
+    enabled = zlib.crc32(pose_bone_array(ob, 'jiggle_enable', dtype=bool).tobytes())
+    return names, enabled
+
+def store_jiggle_topology(ob, plan):
+    if ob.data.library or (plan['indices'] < 0).any():
+        return
+    names, enabled = armature_checksums(ob)
+    ob.data['jiggle_topology'] = {
+        'version': topology_version,
+        'count': len(ob.pose.bones),
+        'bones': plan['indices'].tolist(),
+        'parents': plan['parents'].tolist(),
+        'names': names,
+        'enabled': enabled,
+    }
+
+def load_jiggle_plan(ob):
+    record = ob.data.get('jiggle_topology')
+    if (not record or record.get('version') != topology_version or record['count'] != len(ob.pose.bones)
+        or (record['names'], record['enabled']) != armature_checksums(ob)):
+        return None
+    bones = ob.pose.bones
+    return compile_jiggle_plan(ob, [bones[i].name for i in record['bones']], list(record['parents']))
+
+#read a pose bone property for every bone of the armature in one call
+def pose_bone_array(ob, prop, width=1, dtype=np.float32):
+    arr = np.empty(len(ob.pose.bones)*width, dtype=dtype)
+    ob.pose.bones.foreach_get(prop, arr)
+    if width > 1:
+        return arr.reshape(-1, width)
+    return arr
     
 ##################### NEW STUFF ENDS ##################################
 def update_tree(self,context):
@@ -106,9 +315,9 @@ def jiggle_list_refresh_ui(self,context):
             
     #apply to other selected colliders:
     a = bpy.context.active_object
-    if a and a.type == 'EMPTY':
+    if a and a.type in ('EMPTY', 'MESH'):
         for b in bpy.context.selected_objects:
-            if not b == a and b.type == 'EMPTY':
+            if not b == a and b.type in ('EMPTY', 'MESH'):
                 b.jiggle_collider_enable = a.jiggle_collider_enable
                 
     #iterate through all objects and construct jiggle collider master list
@@ -168,11 +377,17 @@ def jiggle_list_refresh_ui(self,context):
 #                item.name = ob.name
     skip = False
 
+#parameter edits of a bone and the selected bones it's copied to wake their armatures, see armature_idle
+def wake_bones(bone, context):
+    moved_objects.add(bone.id_data.name)
+    moved_objects.update(b.id_data.name for b in context.selected_pose_bones or ())
+
 def active_update(self,context):
     global skip
     if (skip):
         return
     skip = True
+    wake_bones(self, context)
     a = bpy.context.active_pose_bone
     for b in bpy.context.selected_pose_bones:
         if not b == a:
@@ -184,6 +399,7 @@ def stiffness_update(self,context):
     if (skip):
         return
     skip = True
+    wake_bones(self, context)
     a = bpy.context.active_pose_bone
     for b in bpy.context.selected_pose_bones:
         if not b == a:
@@ -195,6 +411,7 @@ def dampen_update(self,context):
     if(skip):
         return
     skip = True
+    wake_bones(self, context)
     a = bpy.context.active_pose_bone
     for b in bpy.context.selected_pose_bones:
         if not b == a:
@@ -206,6 +423,7 @@ def amplitude_update(self,context):
     if (skip):
         return
     skip = True
+    wake_bones(self, context)
     a = bpy.context.active_pose_bone
     for b in bpy.context.selected_pose_bones:
         if not b == a:
@@ -217,6 +435,7 @@ def stretch_update(self,context):
     if (skip):
         return
     skip = True
+    wake_bones(self, context)
     a = bpy.context.active_pose_bone
     for b in bpy.context.selected_pose_bones:
         if not b == a:
@@ -228,17 +447,31 @@ def gravity_update(self,context):
     if (skip):
         return
     skip = True
+    wake_bones(self, context)
     a = bpy.context.active_pose_bone
     for b in bpy.context.selected_pose_bones:
         if not b == a:
             b.jiggle_gravity= a.jiggle_gravity
     skip = False
     
+def force_update(self,context):
+    global skip
+    if (skip):
+        return
+    skip = True
+    wake_bones(self, context)
+    a = bpy.context.active_pose_bone
+    for b in bpy.context.selected_pose_bones:
+        if not b == a:
+            b.jiggle_force= a.jiggle_force
+    skip = False
+    
 def translation_update(self,context):
     global skip
     if (skip):
         return
     skip = True
+    wake_bones(self, context)
     a = bpy.context.active_pose_bone
     for b in bpy.context.selected_pose_bones:
         if not b == a:
@@ -250,6 +483,7 @@ def collision_update(self,context):
     if (skip):
         return
     skip = True
+    wake_bones(self, context)
     a = bpy.context.active_pose_bone
     for b in bpy.context.selected_pose_bones:
         if not b == a:
@@ -261,6 +495,7 @@ def margin_update(self,context):
     if (skip):
         return
     skip = True
+    wake_bones(self, context)
     a = bpy.context.active_pose_bone
     for b in bpy.context.selected_pose_bones:
         if not b == a:
@@ -272,6 +507,7 @@ def friction_update(self,context):
     if (skip):
         return
     skip = True
+    wake_bones(self, context)
     a = bpy.context.active_pose_bone
     for b in bpy.context.selected_pose_bones:
         if not b == a:
@@ -555,82 +791,162 @@ def relative_vector(m1,m2):
 #    print('no r_slice')
 #    return None
 
-def reset_bone(b):
-    #jiggle_bone_pre(b)
-    #bpy.context.view_layer.update()
-    b.jiggle_spring = b.jiggle_spring2 = b.jiggle_velocity = b.jiggle_velocity2 = Vector((0,0,0))
-    #b['jiggle_mat']=b.id_data.matrix_world @ b.matrix
-    bpy.context.scene.frame_set(bpy.context.scene.frame_current)
-    
-    
-
 ######## NEW STUFF STARTS #######################################################################
 
-def jiggle_bone_pre(b):
-    #b.scale.y = Vector(b['scale_start']).y
-    if b.rotation_mode == 'QUATERNION':
-        try:
-            b.rotation_quaternion = Euler(b['rot_start']).to_quaternion()
-        except:
+#make sure a jiggle bone has its rest channels and previous frame state stored
+def jiggle_bone_init(b):
+    if not 'rot_start' in b:
+        if b.rotation_mode == 'QUATERNION':
             b['rot_start'] = b.rotation_quaternion.copy().to_euler()
-    else:
-        try:
-            b.rotation_euler = Euler(b['rot_start'])
-        except:
+        else:
             b['rot_start'] = b.rotation_euler.copy()
-    if b.jiggle_translation != 0:
-        try:
-            b.location = b['loc_start']
-        except:
-            b['loc_start'] = b.location.copy()
-    try:
-        b.scale = b['scale_start']
-    except:
-            b['scale_start'] = b.scale.copy()
-    try:
-        test = b['rot1']
-    except:
-        b['rot1'] = (b.id_data.matrix_world @ b.matrix).to_quaternion()
-    try:
-        test = b['t1']
-    except:
-        b['t1'] = (b.id_data.matrix_world @ b.matrix)
-    try:
-        test = b['rot_col']
-    except:
+    if not 'loc_start' in b:
+        b['loc_start'] = b.location.copy()
+    if not 'scale_start' in b:
+        b['scale_start'] = b.scale.copy()
+    if not 'jiggle_last_mat' in b:
+        b.jiggle_last_mat = b.id_data.matrix_world @ b.matrix
+    if not 'jiggle_last_rot' in b:
+        b.jiggle_last_rot = (b.id_data.matrix_world @ b.matrix).to_quaternion()
+    if not 'jiggle_last_anim' in b:
+        b.jiggle_last_anim = (b.id_data.matrix_world @ b.matrix)
+    if not 'rot_col' in b:
         b['rot_col'] = None
+
+#rest channels of all jiggle bones as arrays, so the pre pass can restore them in bulk
+def jiggle_rest_arrays(ob, names):
+    bones = [ob.pose.bones[name] for name in names]
+    for b in bones:
+        jiggle_bone_init(b)
+    return {
+        'quat_mode': np.array([b.rotation_mode == 'QUATERNION' for b in bones], dtype=bool),
+        'quat': np.array([Euler(b['rot_start']).to_quaternion() for b in bones], dtype=np.float32).reshape(-1, 4),
+        'euler': np.array([b['rot_start'] for b in bones], dtype=np.float32).reshape(-1, 3),
+        'loc': np.array([b['loc_start'] for b in bones], dtype=np.float32).reshape(-1, 3),
+        'scale': np.array([b['scale_start'] for b in bones], dtype=np.float32).reshape(-1, 3),
+    }
+
+#a rotation mode switched after the plan was compiled restores into the channel the bone reads now.
+#pose edits tag the armature's geometry, see jiggle_depsgraph_update
+def refresh_rotation_modes(ob):
+    plan = jiggle_plans.get(ob.name)
+    if plan is None or not plan_valid(ob, plan):
+        return
+    bones = ob.pose.bones
+    plan['rest']['quat_mode'] = np.array([bones[name].rotation_mode == 'QUATERNION' for name in plan['names'] if name in bones], dtype=bool)
+
+#write rest values back over one channel of the jiggle bones. one bulk read, the jiggle bones patched
+#into it and one bulk write, skipped when nothing differs so redundant writes don't tag the pose for
+#extra evaluation. the other bones get back the values just read from them.
+def restore_channel(ob, prop, width, idx, rest):
+    if not len(idx):
+        return
+    values = pose_bone_array(ob, prop, width)
+    changed = (values[idx] != rest).any(axis=1)
+    if changed.any():
+        values[idx[changed]] = rest[changed]
+        ob.pose.bones.foreach_set(prop, values.ravel())
+
+def jiggle_plan_pre(ob, plan):
+    rest = plan['rest']
+    idx = plan['indices']
+    quat_mode = rest['quat_mode']
+    restore_channel(ob, 'rotation_quaternion', 4, idx[quat_mode], rest['quat'][quat_mode])
+    restore_channel(ob, 'rotation_euler', 3, idx[~quat_mode], rest['euler'][~quat_mode])
+    translating = pose_bone_array(ob, 'jiggle_translation')[idx] != 0
+    restore_channel(ob, 'location', 3, idx[translating], rest['loc'][translating])
+    restore_channel(ob, 'scale', 3, idx, rest['scale'])
         
+#same spring updates as jiggle_bone_post repeated over several frames, with the frame's input
+#interpolated linearly between the last and current frame
+def catchup_springs(b, params, force, gvec, t, rate, frames):
+    k = params['jiggle_stiffness']
+    d = params['jiggle_dampen']
+    spring = Vector(b.jiggle_spring)
+    velocity = Vector(b.jiggle_velocity)
+    spring2 = Vector(b.jiggle_spring2)
+    velocity2 = Vector(b.jiggle_velocity2)
+    force = force / frames
+    t = t / frames
+    for i in range(frames):
+        spring = spring + force
+        velocity = velocity*(1-d) - spring*k + gvec*(1-k)
+        spring = spring + velocity / rate
+        tension2 = spring2 - t
+        velocity2 = velocity2*(1-d) - tension2*k
+        spring2 = tension2 + velocity2 / rate
+    b.jiggle_spring = spring
+    b.jiggle_velocity = velocity
+    b.jiggle_spring2 = spring2
+    b.jiggle_velocity2 = velocity2
+
+#exact solution of the per frame spring step over dt base frames. the step
+#    v = v*(1-d) - x*k + force ; x = x + v
+#is the linear map A = [[1-k, 1-d], [-k, 1-d]] on (x-xe, v) around the rest point xe = force/k, so dt
+#frames are A**dt. for a 2x2 map that is D(dt)*A - (1-d)*D(dt-1)*I, where D(t) = (l1**t - l2**t)/(l1 - l2)
+#of the eigenvalues l1, l2 of A. matches the per frame step at dt=1 and broadcasts over bones and channels.
+def oscillator_step(x, v, force, k, d, dt):
+    k = np.clip(k, 1e-4, 1.0)
+    d = np.clip(d, 0.0, 0.999)
+    r = np.sqrt(1-d) #eigenvalue magnitude
+    c = (2-k-d) / (2*r) #cosine of the eigenvalue angle, above 1 the spring is overdamped
+    theta = np.arccos(np.clip(c, -1+1e-6, 1))
+    root = r*np.sqrt(np.maximum(c*c-1, 0))
+    def D(t):
+        oscillating = r**(t-1) * np.sin(t*theta) / np.maximum(np.sin(theta), 1e-9)
+        overdamped = ((r*c+root)**t - (r*c-root)**t) / np.maximum(2*root, 1e-9)
+        critical = t * r**(t-1)
+        return np.where(np.abs(c-1) < 1e-6, critical, np.where(c < 1, oscillating, overdamped))
+    d1 = D(dt)
+    d0 = (1-d) * D(dt-1)
+    y = x - force/k
+    return force/k + ((1-k)*y + (1-d)*v)*d1 - y*d0, (-k*y + (1-d)*v)*d1 - v*d0
+
+#analytic integrator: both springs of a bone advance dt base frames in one step
+def analytic_springs(b, params, force, gvec, t, dt):
+    k = params['jiggle_stiffness']
+    x = np.array([Vector(b.jiggle_spring) + force, Vector(b.jiggle_spring2) - t])
+    v = np.array([b.jiggle_velocity, b.jiggle_velocity2])
+    f = np.array([gvec*(1-k), (0,0,0)])
+    x, v = oscillator_step(x, v, f, k, params['jiggle_dampen'], dt)
+    b.jiggle_spring, b.jiggle_spring2 = x
+    b.jiggle_velocity, b.jiggle_velocity2 = v
+
 def jiggle_bone_post(b, new_b_mat): 
     global skip_jiggle 
     
 #    rate = bpy.context.scene.render.fps/bpy.context.scene.render.fps_base/24
-    rate = bpy.context.scene.jiggle_rate
+    rate = jiggle_scene().jiggle_rate
+    params = bone_params(b)
     
     #translational movement between frames in bone's >>previous<< orientation space
-    vec = relative_vector(Matrix(b['jiggle_mat']), b.id_data.matrix_world @ new_b_mat) * -1
+    vec = relative_vector(Matrix(b.jiggle_last_mat), b.id_data.matrix_world @ new_b_mat) * -1
     vecy = vec.y
     vec.y = 0 #y translation shouldn't affect y rotation, but store it for scaling
     
     #translational vector without any previous jiggle (and y)
-    t1 = Matrix(b['t1'])
+    t1 = Matrix(b.jiggle_last_anim)
     t2 = (b.id_data.matrix_world @ new_b_mat)
     #t = relative_vector(t2, t1) #reversed so it is in the current frame's bone space?
     #ideally world space:
     t = t2.translation - t1.translation
-    b['t1'] = t2
+    b.jiggle_last_anim = t2
 
     #rotational input between frames
-    rot1 = Quaternion(b['rot1'])
+    rot1 = Quaternion(b.jiggle_last_rot)
     #rot1 = Matrix(b['jiggle_mat']).to_quaternion()
     rot2 = (b.id_data.matrix_world @ b.matrix).to_quaternion()
     delta1 = (rot2.to_matrix().to_4x4().inverted() @ rot1.to_matrix().to_4x4()).to_euler()
     deltarot = Vector((delta1.z,-delta1.y,-delta1.x))/4
     #print(delta1)
-    b['rot1']=rot2
+    b.jiggle_last_rot=rot2
     
     #gravity force vector from current orientation (from previous frame)
-    g = bpy.context.scene.gravity * .01 * b.jiggle_gravity
-    gvec = relative_vector(Matrix(b['jiggle_mat']).to_quaternion().to_matrix().to_4x4(), Matrix.Translation(g))
+    g = jiggle_scene().gravity * .01 * params['jiggle_gravity']
+    forces = field_forces.get(b.id_data.name)
+    if forces and b.name in forces:
+        g = g + forces[b.name] * .01 * params['jiggle_force']
+    gvec = relative_vector(Matrix(b.jiggle_last_mat).to_quaternion().to_matrix().to_4x4(), Matrix.Translation(g))
     #gvec = relative_vector(b.matrix.to_quaternion().to_matrix().to_4x4(), Matrix.Translation(g))
     #gvec.magnitude = g.magnitude
     #gvec.x = -0.01
@@ -649,22 +965,29 @@ def jiggle_bone_post(b, new_b_mat):
         
     ######## FAILED!!!!! ###################
     
-    #for rotational tension and jiggle
-    #can i replace tension with just doing the jiggle spring? [yes]
-    b.jiggle_spring = Vector(b.jiggle_spring)+vec+deltarot #input force
-    b.jiggle_velocity = Vector(b.jiggle_velocity)*(1-b.jiggle_dampen)-Vector(b.jiggle_spring)*b.jiggle_stiffness + gvec*(1-b.jiggle_stiffness)
-    b.jiggle_spring = Vector(b.jiggle_spring)+Vector(b.jiggle_velocity) / rate #physics forces if no collision
-    
-    
-    #for translational tension and jiggle
-    tension2 = Vector(b.jiggle_spring2)-t
-    b.jiggle_velocity2 = Vector(b.jiggle_velocity2)*(1-b.jiggle_dampen)-tension2*b.jiggle_stiffness
-    b.jiggle_spring2 = tension2 + Vector(b.jiggle_velocity2) / rate
+    if jiggle_scene().jiggle_integrator == 'ANALYTIC':
+        #springs live in base frame time, a frame covers 1/rate of it and dropped frames need no extra steps
+        analytic_springs(b, params, vec+deltarot, gvec, t, catchup_frames / rate)
+        rate = 1.0
+    elif catchup_frames > 1:
+        #playback dropped frames, spread this frame's input over them instead of resetting
+        catchup_springs(b, params, vec+deltarot, gvec, t, rate, catchup_frames)
+    else:
+        #for rotational tension and jiggle
+        #can i replace tension with just doing the jiggle spring? [yes]
+        b.jiggle_spring = Vector(b.jiggle_spring)+vec+deltarot #input force
+        b.jiggle_velocity = Vector(b.jiggle_velocity)*(1-params['jiggle_dampen'])-Vector(b.jiggle_spring)*params['jiggle_stiffness'] + gvec*(1-params['jiggle_stiffness'])
+        b.jiggle_spring = Vector(b.jiggle_spring)+Vector(b.jiggle_velocity) / rate #physics forces if no collision
+        
+        #for translational tension and jiggle
+        tension2 = Vector(b.jiggle_spring2)-t
+        b.jiggle_velocity2 = Vector(b.jiggle_velocity2)*(1-params['jiggle_dampen'])-tension2*params['jiggle_stiffness']
+        b.jiggle_spring2 = tension2 + Vector(b.jiggle_velocity2) / rate
     #can this all be calculated/stored variables in world space, and then converted to bone space?
     local_spring = t2.to_quaternion().to_matrix().to_4x4().inverted() @ Matrix.Translation(b.jiggle_spring2)
     
     #first frame or inactive should not consider any previous frame
-    if ((bpy.context.scene.frame_current == bpy.context.scene.frame_start) and bpy.context.scene.jiggle_reset) or skip_jiggle or not b.jiggle_active:
+    if ((jiggle_scene().frame_current == jiggle_scene().frame_start) and jiggle_scene().jiggle_reset) or skip_jiggle or not params['jiggle_active']:
         vec = Vector((0,0,0))
         vecy = 0
         deltarot = Vector((0,0,0))
@@ -683,10 +1006,10 @@ def jiggle_bone_post(b, new_b_mat):
 
     #rotation is set via matrix so it can be applied locally before animated orientation changes)
     #this is rotation if there was no collision
-    eulerRot = Euler((math.radians(Vector(b.jiggle_spring).z*-b.jiggle_amplitude*rate), math.radians(Vector(b.jiggle_spring).y*-b.jiggle_amplitude*rate),math.radians(Vector(b.jiggle_spring).x*+b.jiggle_amplitude*rate)))
+    eulerRot = Euler((math.radians(Vector(b.jiggle_spring).z*-params['jiggle_amplitude']*rate), math.radians(Vector(b.jiggle_spring).y*-params['jiggle_amplitude']*rate),math.radians(Vector(b.jiggle_spring).x*+params['jiggle_amplitude']*rate)))
     #translation matrix
     if not b.bone.use_connect:
-        trans = Matrix.Translation(local_spring.translation * b.jiggle_translation)
+        trans = Matrix.Translation(local_spring.translation * params['jiggle_translation'])
     else:
         trans = Matrix.Identity(4)
     #print(trans.translation)    
@@ -722,10 +1045,30 @@ def jiggle_bone_post(b, new_b_mat):
 #    else:
     
     #this is a scale multiplier on keyed bones, but need to account for jiggle pre state
-    s = (1+(local_spring.translation.y*b.jiggle_stretch))
+    s = (1+(local_spring.translation.y*params['jiggle_stretch']))
     s_mat = Matrix.Scale(s, 4, Vector((0,1,0)))  
     
-    new_mat = b.matrix @ trans @ eulerRot.to_matrix().to_4x4() @ s_mat
+    if params['jiggle_collision'] and jiggle_colliders:
+        correction = collide_bone(b, params, new_b_mat @ trans @ eulerRot.to_matrix().to_4x4() @ s_mat)
+        if correction:
+            #keep the collided rotation in the spring so the next frame starts from it
+            eulerRot = (eulerRot.to_matrix() @ correction.to_matrix()).to_euler()
+            amp = params['jiggle_amplitude'] * rate
+            if amp:
+                b.jiggle_spring = Vector((math.degrees(eulerRot.z), -math.degrees(eulerRot.y), -math.degrees(eulerRot.x))) / amp
+            b.jiggle_velocity = Vector(b.jiggle_velocity) * (1 - params['jiggle_collision_friction'])
+    
+    set_jiggle_matrix(b, trans @ eulerRot.to_matrix().to_4x4() @ s_mat)
+    
+    #this becomes the new previous frame matrix: (this one needs parent updates in new_b_mat, where above uses pre-parent b.matrix)
+    new_mat = new_b_mat @ trans @ eulerRot.to_matrix().to_4x4() @ s_mat
+    b.jiggle_last_mat=b.id_data.matrix_world @ new_mat
+    
+    return new_mat
+
+#apply a local jiggle offset on top of the animated (pre-jiggle) pose matrix
+def set_jiggle_matrix(b, offset):
+    new_mat = b.matrix @ offset
     
     for c in b.constraints:
         if c.type == 'CHILD_OF' and not c.mute:
@@ -733,130 +1076,1578 @@ def jiggle_bone_post(b, new_b_mat):
             break
 
     b.matrix = new_mat
+
+######## CHAIN SOLVER ###########################################################################
+#each jiggle bone owns one particle at its tail. root bones are pinned at their animated head, so
+#every root-to-leaf path of the jiggle tree is solved as one unit instead of link by link.
+
+#animated (pre-jiggle) world space heads and tails plus per bone settings, read in bulk
+def chain_inputs(ob, plan):
+    scene = jiggle_scene()
+    idx = plan['indices']
+    mw = np.array(ob.matrix_world, dtype=np.float64)
+    heads = pose_bone_array(ob, 'head', 3)[idx] @ mw[:3,:3].T + mw[:3,3]
+    tails = pose_bone_array(ob, 'tail', 3)[idx] @ mw[:3,:3].T + mw[:3,3]
+    return {
+        'heads': heads,
+        'tails': tails,
+        'stiffness': np.clip(param_array(ob, plan, 'jiggle_stiffness'), 0, 1),
+        'dampen': np.clip(param_array(ob, plan, 'jiggle_dampen'), 0, 1),
+        'gravity': param_array(ob, plan, 'jiggle_gravity')[:,None] * np.array(scene.gravity) + chain_field_forces(ob, plan),
+        'active': param_array(ob, plan, 'jiggle_active'),
+        'self_collision': ob.data.jiggle_self_collision,
+        'radius': np.linalg.norm(tails - heads, axis=1) * param_array(ob, plan, 'jiggle_collision_margin'),
+        'dt': scene.render.fps_base / scene.render.fps,
+        'rate': scene.jiggle_rate,
+    }
+
+#verlet step of all particles followed by a parent-first length projection, numpy only so it
+#doesn't touch blender data. stiffness and dampening keep their per frame meaning at any rate.
+#frames > 1 catches up dropped frames with the targets interpolated from the last frame
+def chain_step(state, inputs, plan, substeps=1, frames=1):
+    parents = plan['parents']
+    substeps = max(1, substeps)
+    n = substeps * frames
+    steps = inputs['rate'] * substeps
+    k = (1 - (1 - inputs['stiffness'])**(1/steps))[:,None]
+    d = (1 - (1 - inputs['dampen'])**(1/steps))[:,None]
+    h = inputs['dt'] / substeps
+    lengths = np.linalg.norm(inputs['tails'] - inputs['heads'], axis=1)
+    pos = state['pos']
+    prev = state['prev']
     
-    #this becomes the new previous frame matrix: (this one needs parent updates in new_b_mat, where above uses pre-parent b.matrix)
-    new_mat = new_b_mat @ trans @ eulerRot.to_matrix().to_4x4() @ s_mat
-    b['jiggle_mat']=b.id_data.matrix_world @ new_mat
+    for s in range(1, n+1):
+        #animation targets are interpolated across substeps
+        f = s / n
+        heads = state['heads'] + (inputs['heads'] - state['heads']) * f
+        tails = state['tails'] + (inputs['tails'] - state['tails']) * f
+        
+        vel = (pos - prev) * (1 - d)
+        prev = pos
+        pos = pos + vel + inputs['gravity'] * h * h
+        pos += (tails - pos) * k
+        
+        for level in plan['levels']:
+            #child heads follow their parent particle
+            anchor = heads[level]
+            p = parents[level]
+            linked = p >= 0
+            anchor[linked] += pos[p[linked]] - tails[p[linked]]
+            span = pos[level] - anchor
+            norm = np.linalg.norm(span, axis=1)
+            norm[norm == 0] = 1
+            pos[level] = anchor + span * (lengths[level] / norm)[:,None]
     
-    return new_mat
+    if inputs['self_collision']:
+        heads = inputs['heads'].copy()
+        linked = parents >= 0
+        heads[linked] += pos[parents[linked]] - inputs['tails'][parents[linked]]
+        self_collide(pos, heads, inputs['radius'], plan)
+    
+    inactive = ~inputs['active']
+    pos[inactive] = inputs['tails'][inactive]
+    prev[inactive] = inputs['tails'][inactive]
+    state['pos'] = pos
+    state['prev'] = prev
+    state['heads'] = inputs['heads']
+    state['tails'] = inputs['tails']
+
+#self collision of an armature's bones as capsules around head to particle. capsules are binned
+#into a uniform grid by their centers with cells as large as the largest capsule, so only pairs in
+#the same or neighboring cells are tested. bones in the same parent chain and siblings never collide.
+half_shell = [(0,0,0)] + [o for o in itertools.product((-1, 0, 1), repeat=3) if o > (0,0,0)]
+
+def cell_keys(cells):
+    cells = cells + 2**20
+    return (cells[:,0] << 42) | (cells[:,1] << 21) | cells[:,2]
+
+#index pairs of capsules whose centers share a cell or are in neighboring cells, each pair once
+def capsule_pairs(centers, cell):
+    cells = np.floor(centers / cell).astype(np.int64)
+    keys = cell_keys(cells)
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    pairs = []
+    for offset in half_shell:
+        neighbor = cell_keys(cells + offset)
+        lo = np.searchsorted(sorted_keys, neighbor, 'left')
+        counts = np.searchsorted(sorted_keys, neighbor, 'right') - lo
+        i = np.repeat(np.arange(len(centers)), counts)
+        j = order[np.repeat(lo - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())]
+        keep = i < j if offset == (0,0,0) else i != j
+        pairs.append(np.stack([i[keep], j[keep]], axis=1))
+    return np.concatenate(pairs)
+
+#closest points of segment pairs p1-q1 and p2-q2
+def segment_closest(p1, q1, p2, q2):
+    d1 = q1 - p1
+    d2 = q2 - p2
+    r = p1 - p2
+    a = np.maximum((d1*d1).sum(axis=1), 1e-12)
+    e = np.maximum((d2*d2).sum(axis=1), 1e-12)
+    b = (d1*d2).sum(axis=1)
+    c = (d1*r).sum(axis=1)
+    f = (d2*r).sum(axis=1)
+    denom = a*e - b*b
+    s = np.where(denom > 1e-12, np.clip((b*f - c*e) / np.maximum(denom, 1e-12), 0, 1), 0)
+    t = (b*s + f) / e
+    s = np.where(t < 0, np.clip(-c / a, 0, 1), np.where(t > 1, np.clip((b - c) / a, 0, 1), s))
+    t = np.clip(t, 0, 1)
+    return p1 + d1*s[:,None], p2 + d2*t[:,None]
+
+def self_collide(pos, heads, radii, plan):
+    if len(pos) < 2:
+        return
+    extent = np.linalg.norm(pos - heads, axis=1) / 2 + radii
+    i, j = capsule_pairs((heads + pos) / 2, max(2 * extent.max(), 1e-6)).T
+    parents = plan['parents']
+    ends = plan['ends']
+    related = (((i < j) & (j < ends[i])) | ((j < i) & (i < ends[j]))
+        | ((parents[i] == parents[j]) & (parents[i] >= 0)))
+    i = i[~related]
+    j = j[~related]
+    if not len(i):
+        return
+    c1, c2 = segment_closest(heads[i], pos[i], heads[j], pos[j])
+    d = c1 - c2
+    dist = np.linalg.norm(d, axis=1)
+    depth = radii[i] + radii[j] - dist
+    hit = (depth > 0) & (dist > 1e-9)
+    push = d[hit] * (depth[hit] / dist[hit] / 2)[:,None]
+    np.add.at(pos, i[hit], push)
+    np.add.at(pos, j[hit], -push)
+
+def chain_reset(ob, inputs):
+    chain_state[ob.name] = {
+        'pos': inputs['tails'].copy(),
+        'prev': inputs['tails'].copy(),
+        'heads': inputs['heads'],
+        'tails': inputs['tails'],
+    }
+
+#convert solved particles back to local bone rotations, parent first like jiggle_tree_post2
+def chain_apply(ob, plan, pos):
+    mw = ob.matrix_world
+    y = Vector((0,1,0))
+    bones = [ob.pose.bones[name] for name in plan['names']]
+    active = param_array(ob, plan, 'jiggle_active')
+    new_mats = [None]*len(bones)
+    for i, b in enumerate(bones):
+        p = plan['parents'][i]
+        if p >= 0:
+            new_b_mat = new_mats[p] @ parent_offset(ob, b, bones[p])
+        else:
+            new_b_mat = b.matrix
+        world = mw @ new_b_mat
+        aim = world.to_quaternion().inverted() @ (Vector(pos[i]) - world.translation)
+        if active[i] and aim.length:
+            rot = y.rotation_difference(aim).to_matrix().to_4x4()
+        else:
+            rot = Matrix.Identity(4)
+        set_jiggle_matrix(b, rot)
+        new_mats[i] = new_b_mat @ rot
+        b.jiggle_last_mat = mw @ new_mats[i]
+
+#reads the chain's inputs, returns the state and inputs to step or None if the chain was reset
+def chain_prepare(ob, plan):
+    scene = jiggle_scene()
+    inputs = chain_inputs(ob, plan)
+    state = chain_state.get(ob.name)
+    if (state is None or len(state['pos']) != len(plan['names']) or skip_jiggle
+        or ((scene.frame_current == scene.frame_start) and scene.jiggle_reset)):
+        chain_reset(ob, inputs)
+        return None
+    return state, inputs
+
+#returns the seconds its step took off the main thread's clock, see solve_armature
+def jiggle_chain_post(ob, bone_tree):
+    plan = get_jiggle_plan(ob, bone_tree)
+    if not plan['names']:
+        return 0
+    stepped = 0
+    if ob.name in chain_jobs:
+        t = time.perf_counter()
+        cost = chain_jobs.pop(ob.name).result() #stepped on a worker thread, raises its errors here
+        stepped = cost - (time.perf_counter() - t) #the step's compute counts instead of the wait for it
+    else:
+        step = chain_prepare(ob, plan)
+        if step:
+            chain_step(*step, plan, chain_substeps(), catchup_frames)
+    if jiggle_colliders:
+        collide_chain(ob, plan, chain_state[ob.name])
+    chain_apply(ob, plan, chain_state[ob.name]['pos'])
+    return stepped
+
+def timed_chain_step(*args):
+    t = time.perf_counter()
+    chain_step(*args)
+    return time.perf_counter() - t
+
+#chain_step only touches numpy arrays, so the chains of all armatures step in parallel on worker
+#threads while blender data is read and written on the main thread before and after
+def dispatch_chain_solves(jiggle_tree):
+    global chain_pool, chain_pool_threads
+    scene = jiggle_scene()
+    threads = scene.jiggle_threads or os.cpu_count() or 1
+    if scene.jiggle_solver != 'CHAIN' or threads < 2:
+        return
+    work = []
+    for ob, bones in jiggle_tree_objects(jiggle_tree):
+        plan = get_jiggle_plan(ob, bones)
+        if (plan['names'] and not ob.name in idle_armatures and not ob.name in instance_leaders
+            and not ob.name in deferred_armatures and not shared_jiggle_result(ob, plan)):
+            step = chain_prepare(ob, plan)
+            if step:
+                work.append((ob.name, step, plan))
+    if len(work) < 2:
+        for name, step, plan in work:
+            job = chain_jobs[name] = Future()
+            job.set_result(timed_chain_step(*step, plan, chain_substeps(), armature_catchup_frames(name)))
+        return
+    if chain_pool is None or chain_pool_threads != threads:
+        if chain_pool:
+            chain_pool.shutdown()
+        chain_pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='jiggle')
+        chain_pool_threads = threads
+    for name, step, plan in work:
+        chain_jobs[name] = chain_pool.submit(timed_chain_step, *step, plan, chain_substeps(), armature_catchup_frames(name))
+
+######## IDLE ARMATURES ########################################################################
+#armatures without animation, moving parents or moving constraint targets whose jiggle has settled
+#would solve to the same pose every frame, so both passes skip them and keep the settled pose
+
+#whether any animation of the object changes values over time, cached until an action is edited
+def object_animated(ob):
+    if ob.name in animated_armatures:
+        return animated_armatures[ob.name]
+    animated = False
+    ad = ob.animation_data
+    if ad:
+        actions = [ad.action] + [strip.action for track in ad.nla_tracks if not track.mute for strip in track.strips]
+        animated = len(ad.drivers) > 0
+        for action in actions:
+            if animated:
+                break
+            if not action:
+                continue
+            for fc in action.fcurves:
+                n = len(fc.keyframe_points)
+                if len(fc.modifiers):
+                    animated = True
+                elif n > 1:
+                    co = np.empty(n*2, dtype=np.float32)
+                    fc.keyframe_points.foreach_get('co', co)
+                    animated = co[1::2].min() != co[1::2].max()
+                if animated:
+                    break
+    animated_armatures[ob.name] = animated
+    return animated
+
+#the armature and other objects its bone constraints follow, found when it's solved. constraint edits
+#tag the armature as moved, so the list holds until its next solve
+def watched_objects(ob):
+    obs = [ob]
+    for b in ob.pose.bones:
+        for c in b.constraints:
+            target = getattr(c, 'target', None)
+            if target and target != ob and not target in obs:
+                obs.append(target)
+    return obs
+
+def watched_unchanged(last):
+    obs = [bpy.data.objects.get(name) for name in last['objects']]
+    return all(obs) and np.array_equal(last['matrices'], np.array([o.matrix_world for o in obs], dtype=np.float32))
+
+def armature_settled(ob, plan):
+    eps = 1e-5
+    idx = plan['indices']
+    for prop in ('jiggle_velocity', 'jiggle_velocity2'):
+        if len(idx) and np.abs(pose_bone_array(ob, prop, 3)[idx]).max() > eps:
+            return False
+    chain = chain_state.get(ob.name)
+    if chain and len(chain['pos']) and np.abs(chain['pos'] - chain['prev']).max() > eps:
+        return False
+    return True
+
+#decided before the frame's fields and colliders are known, so anything that may push differently from
+#the last solve keeps the armature awake. parameter edits mark the armature moved, see wake_bones, and
+#animated or driven parameters make it animated. all checks read cached state and no pose arrays
+def armature_idle(ob, plan):
+    scene = jiggle_scene()
+    last = watch_state.get(ob.name)
+    idle = (scene.jiggle_skip_idle and last is not None and last['settled'] and not ob.name in moved_objects
+        and not ((scene.frame_current == scene.frame_start) and scene.jiggle_reset)
+        and not ob.name in instance_leaders
+        and not fields_changing(scene)
+        and not colliders_reach(last)
+        and not object_animated(ob)
+        and watched_unchanged(last))
+    if idle:
+        idle_armatures.add(ob.name)
+    else:
+        idle_armatures.discard(ob.name)
+    return idle
+
+#moving colliders whose bounds come within reach of the armature's bones as of its last solve. static
+#colliders push a settled armature the same way every frame and don't keep it awake
+def colliders_reach(last):
+    for collider in jiggle_colliders:
+        ob = bpy.data.objects.get(collider['name'])
+        if not collider['motion'] and not (ob and (ob.name in moved_objects or object_animated(ob))):
+            continue
+        if last['reach'] is None or not np.isfinite(collider['motion']):
+            return True
+        slack = collider['motion'] * 2 #its motion of this frame isn't known yet, assume it speeds up
+        if collider_overlaps(collider, last['reach'], slack):
+            return True
+    return False
+
+def collider_overlaps(collider, reach, slack=0.0):
+    low, high = collider['bounds']
+    return (low - slack <= reach[1]).all() and (high + slack >= reach[0]).all()
+
+#colliders of this frame within reach of the armature's bones as posed before its solve
+def colliders_near(ob, plan):
+    if not jiggle_colliders or not param_array(ob, plan, 'jiggle_collision').any():
+        return False
+    reach = collision_reach(ob, plan)
+    return reach is not None and any(collider_overlaps(collider, reach, collider['motion'] * 2) for collider in jiggle_colliders)
+
+#world bounds of the armature's jiggle bone tails grown by their collision radii
+def collision_reach(ob, plan):
+    mw = np.array(ob.matrix_world, dtype=np.float64)
+    heads = pose_bone_array(ob, 'head', 3)[plan['indices']] @ mw[:3,:3].T + mw[:3,3]
+    tails = pose_bone_array(ob, 'tail', 3)[plan['indices']] @ mw[:3,:3].T + mw[:3,3]
+    if not len(tails):
+        return None
+    radius = (np.linalg.norm(tails - heads, axis=1) * param_array(ob, plan, 'jiggle_collision_margin')).max()
+    return (tails.min(axis=0) - radius, tails.max(axis=0) + radius)
+
+def watch_armature(ob, plan):
+    obs = watched_objects(ob)
+    watch_state[ob.name] = {
+        'objects': [o.name for o in obs],
+        'matrices': np.array([o.matrix_world for o in obs], dtype=np.float32),
+        'settled': armature_settled(ob, plan),
+        'reach': collision_reach(ob, plan) if jiggle_colliders else None,
+    }
+    moved_objects.discard(ob.name)
 
 #new tree based jiggle logic
-def jiggle_tree_pre(jiggle_tree,ob=None):
-    if bpy.context.scene.jiggle_enable:
-        for item in jiggle_tree:
-            if 'bones' in jiggle_tree[item]:
-                #process objects
-                if item in bpy.data.objects:
-                    jiggle_tree_pre(jiggle_tree[item]['bones'], bpy.data.objects[item])
-                    jiggle_tree_pre(jiggle_tree[item]['children'])
-                else:
+def jiggle_tree_pre(jiggle_tree):
+    if jiggle_scene().jiggle_enable:
+        for item, node in jiggle_tree_items(jiggle_tree):
+            #process objects
+            if item in bpy.data.objects:
+                ob = bpy.data.objects[item]
+                plan = get_jiggle_plan(ob, node['bones'])
+                if not plan_valid(ob, plan): #bones were added, removed or renamed
                     generate_jiggle_tree()
+                    return
+                if not armature_idle(ob, plan):
+                    jiggle_plan_pre(ob, plan)
             else:
-                #process bones
-                if item in ob.pose.bones:
-                    b = ob.pose.bones[item]
-                    jiggle_bone_pre(b)
-                    jiggle_tree_pre(jiggle_tree[item]['children'], ob)
-                else:
-                    generate_jiggle_tree()
+                generate_jiggle_tree()
+                return
                 
 
 #post assumes pre has ensured jiggle tree items exist?                  
-def jiggle_tree_post2(jiggle_tree, ob=None, parent=None, new_parent_mat=None):
-    global skip_jiggle
-    if bpy.context.scene.jiggle_enable:
-        
-        if bpy.context.scene.jiggle_use_fps_scale:
-            bpy.context.scene.jiggle_rate = bpy.context.scene.render.fps / bpy.context.scene.render.fps_base / bpy.context.scene.jiggle_base_fps
+def update_jiggle_rate():
+    if jiggle_scene().jiggle_use_fps_scale:
+        jiggle_scene().jiggle_rate = jiggle_scene().render.fps / jiggle_scene().render.fps_base / jiggle_scene().jiggle_base_fps
+    else:
+        jiggle_scene().jiggle_rate = 1.0
+
+######## FORCE FIELDS ##########################################################################
+#wind, force, vortex and turbulence field objects push the bones like gravity does, scaled by each
+#bone's jiggle_force. all bone tails of all armatures are sampled in one evaluation per frame.
+#turbulence reads a periodic value noise lattice built once per seed and scrolled over time. falloff
+#follows blender's effectors: sphere, tube and cone shapes, min and max distances and radii, z direction.
+
+field_types = ('WIND', 'FORCE', 'VORTEX', 'TURBULENCE')
+lattice_size = 16
+
+def noise_lattice(seed):
+    lattice = field_lattices.get(seed)
+    if lattice is None:
+        lattice = field_lattices[seed] = np.random.default_rng(seed).uniform(-1, 1, (lattice_size,)*3 + (3,))
+    return lattice
+
+#smooth trilinear lookup of the lattice at (n,3) lattice coordinates, wrapping around
+def lattice_noise(lattice, coords):
+    base = np.floor(coords)
+    f = coords - base
+    f = f*f*(3 - 2*f)
+    i = base.astype(int)
+    result = np.zeros(coords.shape)
+    for corner in itertools.product((0, 1), repeat=3):
+        w = np.prod(np.where(corner, f, 1 - f), axis=1)
+        c = (i + corner) % lattice_size
+        result += lattice[c[:,0], c[:,1], c[:,2]] * w[:,None]
+    return result
+
+def sample_force_fields(fields, points, frame):
+    total = np.zeros(points.shape)
+    for field_ob in fields:
+        field = field_ob.field
+        mw = np.array(field_ob.matrix_world, dtype=np.float64)
+        axis = mw[:3,2] / max(np.linalg.norm(mw[:3,2]), 1e-9)
+        rel = points - mw[:3,3]
+        dist = np.linalg.norm(rel, axis=1)
+        if field.type == 'WIND':
+            force = np.broadcast_to(axis, points.shape) * field.strength
+        elif field.type == 'FORCE':
+            force = rel / np.maximum(dist, 1e-9)[:,None] * field.strength
+        elif field.type == 'VORTEX':
+            swirl = np.cross(axis, rel)
+            force = swirl / np.maximum(np.linalg.norm(swirl, axis=1), 1e-9)[:,None] * field.strength
+        else:
+            coords = rel / max(field.size, 1e-3) + frame * 0.1 #scroll the lattice over time
+            force = lattice_noise(noise_lattice(field.seed), coords) * field.strength
+        total += force * field_falloff(field, rel, axis, dist)[:,None]
+    return total
+
+#blender's falloff_func, of distances or radii: full strength inside min, nothing past max, the power
+#falloff counted from min in between
+def falloff_curve(values, use_min, low, use_max, high, power):
+    low = low if use_min else 0.0
+    result = np.maximum(1 + values - low, 1e-9) ** -power
+    if use_max:
+        result = np.where(values > high, 0.0, result)
+    if use_min:
+        result = np.where(values < low, 1.0, result)
+    return result
+
+def field_falloff(field, rel, axis, dist):
+    along = rel @ axis
+    weight = np.ones(len(rel))
+    if field.z_direction == 'POSITIVE':
+        weight = weight * (along >= 0)
+    elif field.z_direction == 'NEGATIVE':
+        weight = weight * (along <= 0)
+    distance = lambda values: falloff_curve(values, field.use_min_distance, field.distance_min,
+        field.use_max_distance, field.distance_max, field.falloff_power)
+    radial = lambda values: falloff_curve(values, field.use_radial_min, field.radial_min,
+        field.use_radial_max, field.radial_max, field.radial_falloff)
+    if field.falloff_type == 'TUBE':
+        return weight * distance(np.abs(along)) * radial(np.linalg.norm(rel - along[:,None] * axis, axis=1))
+    if field.falloff_type == 'CONE':
+        angle = np.degrees(np.arccos(np.clip(along / np.maximum(dist, 1e-9), -1, 1)))
+        return weight * distance(np.abs(along)) * radial(angle)
+    return weight * distance(dist)
+
+#force field objects per scene, rescanned when the scene's object count changes or an object gets a field
+def scene_fields(scene):
+    count = len(scene.objects)
+    cached = field_objects.get(scene.name)
+    if cached is None or cached[0] != count:
+        cached = field_objects[scene.name] = (count, [ob.name for ob in scene.objects if ob.field and ob.field.type in field_types])
+    fields = [bpy.data.objects.get(name) for name in cached[1]]
+    return [ob for ob in fields if ob and ob.field and ob.field.type in field_types and ob.field.strength]
+
+#fields whose push changes over time: turbulence scrolls, moved, edited or animated fields move
+def fields_changing(scene):
+    if not scene.jiggle_use_force_fields:
+        return False
+    return any(ob.field.type == 'TURBULENCE' or ob.name in moved_objects or object_animated(ob) for ob in scene_fields(scene))
+
+def update_field_forces(jiggle_tree):
+    field_forces.clear()
+    scene = jiggle_scene()
+    if not scene.jiggle_use_force_fields:
+        return
+    fields = scene_fields(scene)
+    if not fields:
+        return
+    armatures = []
+    for ob, bones in jiggle_tree_objects(jiggle_tree):
+        plan = get_jiggle_plan(ob, bones)
+        mw = np.array(ob.matrix_world, dtype=np.float64)
+        armatures.append((ob, plan, pose_bone_array(ob, 'tail', 3)[plan['indices']] @ mw[:3,:3].T + mw[:3,3]))
+    if not armatures:
+        return
+    forces = sample_force_fields(fields, np.concatenate([tails for ob, plan, tails in armatures]), scene.frame_current)
+    start = 0
+    for ob, plan, tails in armatures:
+        values = forces[start:start + len(tails)]
+        start += len(tails)
+        if values.any():
+            field_forces[ob.name] = dict(zip(plan['names'], map(Vector, values)))
+
+#the chain solver takes forces as world acceleration next to gravity
+def chain_field_forces(ob, plan):
+    forces = field_forces.get(ob.name)
+    if not forces:
+        return 0
+    return np.array([forces[name] for name in plan['names']]) * param_array(ob, plan, 'jiggle_force')[:,None]
+
+######## COLLIDERS #############################################################################
+#objects with jiggle_collider_enable push the tails of bones with jiggle_collision out by a radius of
+#jiggle_collision_margin times the bone length. empties are spheres of their display size, meshes
+#collide with their evaluated, deformed surface through a bvh tree shared by all bones. points outside
+#a collider's bounds skip its queries.
+
+pair_block = 1 << 18 #voxel and triangle pairs tested per numpy step of the sdf build
+
+def safe_divide(a, b):
+    return a / np.where(b == 0, 1, b)
+
+#closest points on triangles a, b, c of (k,3) point and triangle pairs, by voronoi region
+def closest_on_triangles(p, a, b, c):
+    ab, ac, ap, bp, cp = b - a, c - a, p - a, p - b, p - c
+    dot = lambda u, v: np.einsum('ij,ij->i', u, v)
+    d1, d2, d3, d4, d5, d6 = dot(ab, ap), dot(ac, ap), dot(ab, bp), dot(ac, bp), dot(ab, cp), dot(ac, cp)
+    va, vb, vc = d3*d6 - d5*d4, d5*d2 - d1*d6, d1*d4 - d3*d2
+    total = va + vb + vc
+    regions = [
+        ((d1 <= 0) & (d2 <= 0), a),
+        ((d3 >= 0) & (d4 <= d3), b),
+        ((d6 >= 0) & (d5 <= d6), c),
+        ((vc <= 0) & (d1 >= 0) & (d3 <= 0), a + ab * safe_divide(d1, d1 - d3)[:,None]),
+        ((vb <= 0) & (d2 >= 0) & (d6 <= 0), a + ac * safe_divide(d2, d2 - d6)[:,None]),
+        ((va <= 0) & (d4 >= d3) & (d5 >= d6), b + (c - b) * safe_divide(d4 - d3, (d4 - d3) + (d5 - d6))[:,None]),
+    ]
+    result = a + ab * safe_divide(vb, total)[:,None] + ac * safe_divide(vc, total)[:,None]
+    for inside, closest in reversed(regions): #earlier regions win
+        result = np.where(inside[:,None], closest, result)
+    return result
+
+#the bvh tree is built in object space once and kept until the depsgraph reports a geometry change,
+#moving the object only changes the transform queries go through
+def mesh_collider(ob, depsgraph, changed):
+    cache = collider_cache.get(ob.name)
+    if cache is None or ob.name in changed:
+        ob_eval = ob.evaluated_get(depsgraph)
+        mesh = ob_eval.to_mesh()
+        mesh.calc_loop_triangles()
+        co = np.empty(len(mesh.vertices)*3, dtype=np.float32)
+        mesh.vertices.foreach_get('co', co)
+        tris = np.empty(len(mesh.loop_triangles)*3, dtype=np.int32)
+        mesh.loop_triangles.foreach_get('vertices', tris)
+        ob_eval.to_mesh_clear()
+        co = co.reshape(-1, 3)
+        cache = collider_cache[ob.name] = {
+            'tree': BVHTree.FromPolygons(co.tolist(), tris.reshape(-1, 3).tolist()),
+            'low': co.min(axis=0) if len(co) else np.zeros(3),
+            'high': co.max(axis=0) if len(co) else np.zeros(3),
+        }
+    mw = np.array(ob.matrix_world, dtype=np.float64)
+    corners = np.array(list(itertools.product(*zip(cache['low'], cache['high'])))) @ mw[:3,:3].T + mw[:3,3]
+    return {'type': 'MESH', 'tree': cache['tree'], 'matrix': mw, 'inverse': np.linalg.inv(mw),
+        'bounds': (corners.min(axis=0), corners.max(axis=0))}
+
+def sphere_collider(ob):
+    mw = np.array(ob.matrix_world, dtype=np.float64)
+    r = ob.empty_display_size * max(ob.matrix_world.to_scale())
+    center = mw[:3,3]
+    return {'type': 'SPHERE', 'center': center, 'radius': r, 'bounds': (center - r, center + r)}
+
+#colliders of the handler's depsgraph, each with how far its bounds moved since the previous frame
+def update_colliders(jiggle_tree, depsgraph):
+    last = {collider['name']: collider['bounds'] for collider in jiggle_colliders}
+    jiggle_colliders.clear()
+    scene = jiggle_scene()
+    if not any(pose_bone_array(ob, 'jiggle_collision', dtype=bool)[get_jiggle_plan(ob, bones)['indices']].any()
+               for ob, bones in jiggle_tree_objects(jiggle_tree)):
+        return
+    changed = {update.id.original.name for update in depsgraph.updates
+               if isinstance(update.id, bpy.types.Object) and update.is_updated_geometry}
+    for ob in scene.objects:
+        if ob.jiggle_collider_enable:
+            if ob.type == 'MESH' and ob.jiggle_collider_type == 'SDF':
+                collider = sdf_collider(ob, depsgraph)
+            elif ob.type == 'MESH':
+                collider = mesh_collider(ob, depsgraph, changed)
+            elif ob.type == 'EMPTY':
+                collider = sphere_collider(ob)
+            else:
+                continue
+            collider['name'] = ob.name
+            bounds = last.get(ob.name)
+            collider['motion'] = np.inf if bounds is None else float(np.abs(np.concatenate(bounds) - np.concatenate(collider['bounds'])).max())
+            if ob.name in changed:
+                collider['motion'] = max(collider['motion'], 1e-6) #deformed in place, its bounds may hold still
+            jiggle_colliders.append(collider)
+    for name in list(collider_cache):
+        if not name in scene.objects:
+            del collider_cache[name]
+
+#moves (n,3) world points out of all colliders, returns the points and which of them were pushed
+def collide_points(points, radii):
+    points = np.array(points, dtype=np.float64)
+    hit = np.zeros(len(points), dtype=bool)
+    for collider in jiggle_colliders:
+        low, high = collider['bounds']
+        near = np.flatnonzero(((points >= low - radii[:,None]) & (points <= high + radii[:,None])).all(axis=1))
+        if not len(near):
+            continue
+        if collider['type'] == 'SDF':
+            collide_sdf(collider, points, radii, near, hit)
+        elif collider['type'] == 'SPHERE':
+            d = points[near] - collider['center']
+            dist = np.linalg.norm(d, axis=1)
+            reach = collider['radius'] + radii[near]
+            inside = (dist < reach) & (dist > 0)
+            i = near[inside]
+            points[i] = collider['center'] + d[inside] * (reach[inside] / dist[inside])[:,None]
+            hit[i] = True
+        else:
+            tree, mw, inv = collider['tree'], collider['matrix'], collider['inverse']
+            for i in near:
+                loc, normal, index, dist = tree.find_nearest(Vector(inv[:3,:3] @ points[i] + inv[:3,3]))
+                if loc is None:
+                    continue
+                loc = mw[:3,:3] @ np.array(loc) + mw[:3,3]
+                normal = inv[:3,:3].T @ np.array(normal) #normals transform by the inverse transpose
+                normal /= max(np.linalg.norm(normal), 1e-12)
+                depth = radii[i] - (points[i] - loc) @ normal
+                if depth > 0:
+                    points[i] += normal * depth
+                    hit[i] = True
+    return points, hit
+
+#static meshes are voxelized once into a grid of signed distances in object space (negative inside),
+#saved next to the .blend and memory mapped on later loads, so every frame only costs a vectorized
+#trilinear lookup of all points. moving the object rigidly needs no rebuild.
+#
+#the build is triangle major: distances are exact within sdf_band voxels of each triangle and carried
+#outward along the grid axes beyond, which overestimates them far from the surface where only their
+#sign and slope matter. inside is decided by the parity of surface crossings of rays along each axis,
+#the majority of the three axes holds up to small holes in the mesh.
+
+sdf_band = 2 #voxels around each triangle with exact distances
+
+def sdf_dir():
+    if not bpy.data.filepath:
+        return None
+    return os.path.join(os.path.dirname(bpy.data.filepath), 'jiggle_sdf', bpy.path.display_name_from_filepath(bpy.data.filepath))
+
+def sdf_path(ob, key):
+    folder = sdf_dir()
+    if not folder:
+        return None
+    return os.path.join(folder, '%s_%08x.npy' %(bpy.path.clean_name(ob.name), key))
+
+#remove grids of objects that are gone or no longer static colliders, and older grids of a rebuilt one
+def prune_sdf_files(ob=None, path=None):
+    folder = sdf_dir()
+    if not folder or not os.path.isdir(folder):
+        return
+    owners = {bpy.path.clean_name(o.name) for o in bpy.data.objects
+              if o.type == 'MESH' and o.jiggle_collider_enable and o.jiggle_collider_type == 'SDF'}
+    for name in os.listdir(folder):
+        owner = name.rsplit('_', 1)[0]
+        file = os.path.join(folder, name)
+        if owner not in owners or (ob is not None and owner == bpy.path.clean_name(ob.name) and file != path):
+            try:
+                os.remove(file)
+            except OSError:
+                pass #still memory mapped on some platforms, the next prune gets it
+
+#every cell of the inclusive integer boxes lo..hi, (m,d) each, as chunks of (owner box, (k,d) cell)
+def box_cells(lo, hi):
+    dims = np.maximum(hi - lo + 1, 0)
+    counts = dims.prod(axis=1)
+    ends = np.cumsum(counts)
+    total = int(ends[-1]) if len(ends) else 0
+    for start in range(0, total, pair_block):
+        pos = np.arange(start, min(start + pair_block, total))
+        owner = np.searchsorted(ends, pos, side='right')
+        local = pos - (ends[owner] - counts[owner])
+        cells = np.empty((len(pos), lo.shape[1]), dtype=np.int64)
+        for axis in reversed(range(lo.shape[1])):
+            cells[:,axis] = lo[owner,axis] + local % dims[owner,axis]
+            local //= dims[owner,axis]
+        yield owner, cells
+
+#distances carried along one grid axis, each voxel takes the nearest value plus the steps to it
+def carry_distances(dist, axis, voxel):
+    ramp = (np.arange(dist.shape[axis]) * voxel).reshape([-1 if a == axis else 1 for a in range(3)])
+    forward = np.minimum.accumulate(dist - ramp, axis=axis) + ramp
+    backward = np.flip(np.minimum.accumulate(np.flip(dist + ramp, axis), axis=axis), axis) - ramp
+    return np.minimum(forward, backward)
+
+def unsigned_sdf(corners, low, voxel, shape):
+    dist = np.full(int(np.prod(shape)), np.inf)
+    lo = np.clip(np.floor((corners.min(axis=1) - low) / voxel).astype(int) - sdf_band, 0, np.array(shape) - 1)
+    hi = np.clip(np.ceil((corners.max(axis=1) - low) / voxel).astype(int) + sdf_band, 0, np.array(shape) - 1)
+    normals = np.cross(corners[:,1] - corners[:,0], corners[:,2] - corners[:,0])
+    normals /= np.maximum(np.linalg.norm(normals, axis=1), 1e-12)[:,None]
+    for owner, cells in box_cells(lo, hi):
+        p = low + cells * voxel
+        near = np.abs(np.einsum('ij,ij->i', p - corners[owner,0], normals[owner])) <= sdf_band * voxel #the triangle's slab
+        owner, cells, p = owner[near], cells[near], p[near]
+        c = corners[owner]
+        d = np.linalg.norm(p - closest_on_triangles(p, c[:,0], c[:,1], c[:,2]), axis=1)
+        index = np.ravel_multi_index(cells.T, shape)
+        order = np.lexsort((d, index))
+        first = order[np.unique(index[order], return_index=True)[1]] #nearest triangle of every voxel
+        dist[index[first]] = np.minimum(dist[index[first]], d[first])
+    dist = dist.reshape(shape)
+    for axis in range(3):
+        dist = carry_distances(dist, axis, voxel)
+    return dist
+
+def inside_sdf(corners, low, voxel, shape):
+    votes = np.zeros(shape, dtype=np.int8)
+    for axis in range(3):
+        u, v = [a for a in range(3) if a != axis]
+        jitter = np.array([0.1234567, 0.2345678]) * 1e-3 * voxel #rays off the grid rows miss edges and corners
+        flat = corners[:,:,[u,v]]
+        origin = low[[u,v]] + jitter
+        size = np.array([shape[u], shape[v]])
+        lo = np.clip(np.ceil((flat.min(axis=1) - origin) / voxel).astype(int), 0, size - 1)
+        hi = np.clip(np.floor((flat.max(axis=1) - origin) / voxel).astype(int), -1, size - 1)
+        crossings = np.zeros(shape[u] * shape[v] * (shape[axis] + 1), dtype=np.int64)
+        for owner, cells in box_cells(lo, hi):
+            q = origin + cells * voxel
+            t = flat[owner]
+            e1, e2, r = t[:,1] - t[:,0], t[:,2] - t[:,0], q - t[:,0]
+            den = e1[:,0]*e2[:,1] - e1[:,1]*e2[:,0]
+            b1 = safe_divide(r[:,0]*e2[:,1] - r[:,1]*e2[:,0], den)
+            b2 = safe_divide(e1[:,0]*r[:,1] - e1[:,1]*r[:,0], den)
+            hit = (den != 0) & (b1 >= 0) & (b2 >= 0) & (b1 + b2 <= 1)
+            c = corners[owner[hit]][:,:,axis]
+            x = c[:,0] + b1[hit]*(c[:,1] - c[:,0]) + b2[hit]*(c[:,2] - c[:,0])
+            i = np.clip(np.ceil((x - low[axis]) / voxel), 0, shape[axis]).astype(int) #first voxel past the crossing
+            index = np.ravel_multi_index((cells[hit,0], cells[hit,1], i), (shape[u], shape[v], shape[axis] + 1))
+            crossings += np.bincount(index, minlength=len(crossings))
+        odd = np.cumsum(crossings.reshape(shape[u], shape[v], -1), axis=2)[:,:,:-1] % 2
+        votes += np.moveaxis(odd, (0, 1, 2), (u, v, axis)).astype(np.int8)
+    return votes >= 2
+
+def build_sdf(co, tris, low, voxel, shape):
+    corners = co.astype(np.float64)[tris]
+    low = np.asarray(low, dtype=np.float64)
+    dist = unsigned_sdf(corners, low, voxel, shape)
+    return np.where(inside_sdf(corners, low, voxel, shape), -dist, dist).astype(np.float32)
+
+def load_sdf(ob, depsgraph):
+    ob_eval = ob.evaluated_get(depsgraph)
+    mesh = ob_eval.to_mesh()
+    mesh.calc_loop_triangles()
+    co = np.empty(len(mesh.vertices)*3, dtype=np.float32)
+    mesh.vertices.foreach_get('co', co)
+    tris = np.empty(len(mesh.loop_triangles)*3, dtype=np.int32)
+    mesh.loop_triangles.foreach_get('vertices', tris)
+    ob_eval.to_mesh_clear()
+    co = co.reshape(-1, 3)
+    tris = tris.reshape(-1, 3)
+    resolution = ob.jiggle_sdf_resolution
+    if not len(tris):
+        return None
+    voxel = max((co.max(axis=0) - co.min(axis=0)).max() / resolution, 1e-6)
+    low = co.min(axis=0) - voxel*2
+    shape = tuple(np.ceil((co.max(axis=0) + voxel*2 - low) / voxel).astype(int) + 1)
+    key = zlib.crc32(tris.tobytes(), zlib.crc32(co.tobytes(), resolution))
+    path = sdf_path(ob, key)
+    if path and os.path.exists(path):
+        grid = np.load(path, mmap_mode='r')
+    else:
+        print('voxelizing %s' %ob.name)
+        grid = build_sdf(co, tris, low, voxel, shape)
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            np.save(path, grid)
+            grid = np.load(path, mmap_mode='r')
+            prune_sdf_files(ob, path)
+    return {'grid': grid, 'low': low, 'voxel': voxel, 'resolution': resolution}
+
+def sdf_collider(ob, depsgraph):
+    sdf = sdf_grids.get(ob.name)
+    if sdf is None or sdf['resolution'] != ob.jiggle_sdf_resolution:
+        sdf = sdf_grids[ob.name] = load_sdf(ob, depsgraph) or {'grid': None, 'resolution': ob.jiggle_sdf_resolution}
+    if sdf['grid'] is None:
+        return {'type': 'NONE', 'bounds': (np.full(3, np.inf), np.full(3, -np.inf))}
+    mw = np.array(ob.matrix_world, dtype=np.float64)
+    size = (np.array(sdf['grid'].shape) - 1) * sdf['voxel']
+    corners = sdf['low'] + np.array(list(itertools.product((0, 1), repeat=3))) * size
+    corners = corners @ mw[:3,:3].T + mw[:3,3]
+    return {'type': 'SDF', 'sdf': sdf, 'matrix': mw, 'inverse': np.linalg.inv(mw),
+        'scale': max(ob.matrix_world.to_scale()), 'bounds': (corners.min(axis=0), corners.max(axis=0))}
+
+#trilinear signed distance at (n,3) voxel coordinates
+def sample_sdf(grid, coords):
+    coords = np.clip(coords, 0, np.array(grid.shape) - 1.000001)
+    base = np.floor(coords).astype(int)
+    f = coords - base
+    result = np.zeros(len(coords))
+    for corner in itertools.product((0, 1), repeat=3):
+        c = base + corner
+        result += grid[c[:,0], c[:,1], c[:,2]] * np.prod(np.where(corner, f, 1 - f), axis=1)
+    return result
+
+def collide_sdf(collider, points, radii, near, hit):
+    sdf = collider['sdf']
+    mw, inv = collider['matrix'], collider['inverse']
+    local = points[near] @ inv[:3,:3].T + inv[:3,3]
+    coords = (local - sdf['low']) / sdf['voxel']
+    reach = radii[near] / collider['scale']
+    depth = reach - sample_sdf(sdf['grid'], coords)
+    inside = depth > 0
+    if not inside.any():
+        return
+    c = coords[inside]
+    grad = np.stack([sample_sdf(sdf['grid'], c + e) - sample_sdf(sdf['grid'], c - e) for e in np.eye(3) * 0.5], axis=1)
+    grad /= np.maximum(np.linalg.norm(grad, axis=1), 1e-9)[:,None]
+    local = local[inside] + grad * depth[inside,None]
+    i = near[inside]
+    points[i] = local @ mw[:3,:3].T + mw[:3,3]
+    hit[i] = True
+
+#rotation that moves a bone's tail out of the colliders, in the bone's space, or None
+def collide_bone(b, params, mat):
+    world = b.id_data.matrix_world @ mat
+    tail = world @ Vector((0, b.length, 0))
+    points, hit = collide_points([tail], np.array([b.length * params['jiggle_collision_margin']]))
+    if not hit[0]:
+        return None
+    aim = world.to_quaternion().inverted() @ (Vector(points[0]) - world.translation)
+    return Vector((0,1,0)).rotation_difference(aim).to_euler()
+
+#pushed chain particles lose their velocity into the surface, friction also damps the rest
+def collide_chain(ob, plan, state):
+    mask = param_array(ob, plan, 'jiggle_collision')
+    if not mask.any():
+        return
+    lengths = np.linalg.norm(state['tails'] - state['heads'], axis=1)
+    radii = lengths[mask] * param_array(ob, plan, 'jiggle_collision_margin')[mask]
+    points, hit = collide_points(state['pos'][mask], radii)
+    i = np.flatnonzero(mask)[hit]
+    friction = param_array(ob, plan, 'jiggle_collision_friction')[i,None]
+    state['prev'][i] = points[hit] - (state['pos'][i] - state['prev'][i]) * (1 - friction)
+    state['pos'][i] = points[hit]
+
+######## FRAME BUDGET ##########################################################################
+#during viewport playback the solve of a frame should fit jiggle_frame_budget. over budget the chain
+#solver first drops substeps, then the lowest priority armatures reuse the jiggle offsets of their
+#last solve on top of the current animation and catch up the deferred frames once solved again.
+#renders, bakes and scrubbing always solve at full quality.
+
+def chain_substeps():
+    return budget_substeps or jiggle_scene().jiggle_chain_substeps
+
+def armature_catchup_frames(name):
+    return catchup_frames + deferred_frames.get(name, 0)
+
+#foreach_get flattens matrices column by column, (n,16) columns to (n,4,4) matrices and back
+def basis_matrices(values):
+    return values.reshape(-1,4,4).transpose(0,2,1)
+
+def basis_columns(mats):
+    return mats.transpose(0,2,1).reshape(-1,16)
+
+def store_jiggle_offsets(ob, plan, basis):
+    solved = pose_bone_array(ob, 'matrix_basis', 16)[plan['indices']]
+    jiggle_offsets[ob.name] = np.linalg.inv(basis_matrices(basis)) @ basis_matrices(solved)
+
+def apply_jiggle_offsets(ob, plan):
+    values = pose_bone_array(ob, 'matrix_basis', 16)
+    values[plan['indices']] = basis_columns(basis_matrices(values[plan['indices']]) @ jiggle_offsets[ob.name])
+    ob.pose.bones.foreach_set('matrix_basis', values.ravel())
+
+def schedule_frame_budget(jiggle_tree):
+    global budget_substeps
+    scene = jiggle_scene()
+    budget_substeps = 0
+    playing = bpy.context.screen is not None and bpy.context.screen.is_animation_playing
+    deferred_armatures.clear()
+    if skip_jiggle:
+        deferred_frames.clear()
+    if not scene.jiggle_frame_budget or not playing or render or skip_jiggle:
+        return
+    budget = scene.jiggle_frame_budget / 1000
+    candidates = []
+    for ob, bones in jiggle_tree_objects(jiggle_tree):
+        if not ob.name in idle_armatures and not ob.name in instance_leaders:
+            candidates.append((ob, get_jiggle_plan(ob, bones)))
+    total = sum(solve_costs.get(ob.name, 0) for ob, plan in candidates)
+    substeps = scene.jiggle_chain_substeps
+    if total > budget and scene.jiggle_solver == 'CHAIN' and substeps > 1:
+        budget_substeps = max(1, int(substeps * budget / total))
+    #highest priority first, armatures deferred longer move up. the first one always solves
+    candidates.sort(key=lambda c: (c[0].data.jiggle_priority, deferred_frames.get(c[0].name, 0)), reverse=True)
+    spent = 0
+    for i, (ob, plan) in enumerate(candidates):
+        cost = solve_costs.get(ob.name, 0) * (budget_substeps or substeps) / substeps
+        deferred = deferred_frames.get(ob.name, 0) + catchup_frames
+        offsets = jiggle_offsets.get(ob.name)
+        if (i and spent + cost > budget and offsets is not None and len(offsets) == len(plan['indices'])
+            and deferred < scene.jiggle_catchup_frames):
+            deferred_armatures.add(ob.name)
+            deferred_frames[ob.name] = deferred
+        else:
+            spent += cost
+
+#solve one frame of the whole tree
+def solve_jiggle_tree(jiggle_tree, depsgraph):
+    if jiggle_scene().jiggle_enable:
+        update_jiggle_rate()
+        update_field_forces(jiggle_tree)
+        update_colliders(jiggle_tree, depsgraph)
+        share_instances(jiggle_tree)
+        schedule_frame_budget(jiggle_tree)
+        dispatch_chain_solves(jiggle_tree)
+    try:
+        jiggle_tree_post2(jiggle_tree)
+    finally:
+        for job in chain_jobs.values():
+            if job:
+                job.cancel()
+        chain_jobs.clear()
+        moved_objects.intersection_update(jiggle_plans) #every armature has seen moved fields and colliders
+
+#one armature's solve, timed for the frame budget. frames it was deferred are caught up
+def solve_armature(ob, plan, bone_tree):
+    global catchup_frames
+    frames = catchup_frames
+    catchup_frames = armature_catchup_frames(ob.name)
+    deferred_frames.pop(ob.name, None)
+    budgeted = jiggle_scene().jiggle_frame_budget > 0
+    if budgeted:
+        basis = pose_bone_array(ob, 'matrix_basis', 16)[plan['indices']]
+    t = time.perf_counter()
+    stepped = 0
+    try:
+        if jiggle_scene().jiggle_solver == 'CHAIN':
+            stepped = jiggle_chain_post(ob, bone_tree)
         else:
-            bpy.context.scene.jiggle_rate = 1.0
+            jiggle_plan_post(ob, plan)
+    finally:
+        catchup_frames = frames
+    cost = time.perf_counter() - t + stepped
+    if budget_substeps:
+        cost *= jiggle_scene().jiggle_chain_substeps / budget_substeps #normalized to full quality
+    solve_costs[ob.name] = cost if ob.name not in solve_costs else solve_costs[ob.name]*0.7 + cost*0.3
+    if budgeted:
+        store_jiggle_offsets(ob, plan, basis)
+
+def jiggle_tree_post2(jiggle_tree):
+    if jiggle_scene().jiggle_enable:
+        update_jiggle_rate()
             
-        for item in jiggle_tree:
-            if 'bones' in jiggle_tree[item]:
-                jiggle_tree_post2(jiggle_tree[item]['bones'], bpy.data.objects[item])
-                jiggle_tree_post2(jiggle_tree[item]['children'])
+        for item, node in jiggle_tree_items(jiggle_tree):
+            ob = bpy.data.objects[item]
+            plan = get_jiggle_plan(ob, node['bones'])
+            result = shared_jiggle_result(ob, plan)
+            if ob.name in idle_armatures:
+                pass #settled and nothing moves it, the pose from its last solve still holds
+            elif result:
+                apply_jiggle_result(ob, plan, result)
+            elif ob.name in instance_leaders and instance_result(ob):
+                apply_jiggle_result(ob, plan, jiggle_results[instance_leaders[ob.name][0]])
+                store_jiggle_result(ob, plan)
+                watch_armature(ob, plan)
+            elif ob.name in deferred_armatures:
+                apply_jiggle_offsets(ob, plan)
+                store_jiggle_result(ob, plan)
             else:
-                b = ob.pose.bones[item]
-                if parent: #b's matrix should be offset by parent offset if it has one
-                    diff_mat = (b.matrix.inverted() @ parent.matrix).inverted() #b and parent are both pre-jiggle (no view_layer updates)
-                    new_b_mat = new_parent_mat @ diff_mat
-                else:
-                    new_b_mat = b.matrix
-                new_p_mat = jiggle_bone_post(b, new_b_mat) #jiggle_bone_post should be updated to do all calcs on new_b_mat
-                jiggle_tree_post2(jiggle_tree[item]['children'], ob, b, new_p_mat)
-                if ((bpy.context.scene.frame_current == bpy.context.scene.frame_start) and bpy.context.scene.jiggle_reset) or skip_jiggle or not b.jiggle_enable: #if not jiggle enabled, it not it the list so this seems pointless?
-                    b['jiggle_mat']=b.id_data.matrix_world @ b.matrix
+                solve_armature(ob, plan, node['bones'])
+                store_jiggle_result(ob, plan)
+                watch_armature(ob, plan)
+
+#per bone solve in plan order, so every bone starts from its jiggle parent's solved matrix
+def jiggle_plan_post(ob, plan):
+    scene = jiggle_scene()
+    bones = ob.pose.bones
+    names = plan['names']
+    new_mats = [None]*len(names)
+    for i, name in enumerate(names):
+        b = bones[name]
+        p = plan['parents'][i]
+        if p >= 0: #b's matrix should be offset by parent offset if it has one
+            diff_mat = parent_offset(ob, b, bones[names[p]]) #b and parent are both pre-jiggle (no view_layer updates)
+            new_b_mat = new_mats[p] @ diff_mat
+        else:
+            new_b_mat = b.matrix
+        new_mats[i] = jiggle_bone_post(b, new_b_mat) #jiggle_bone_post should be updated to do all calcs on new_b_mat
+        if ((scene.frame_current == scene.frame_start) and scene.jiggle_reset) or skip_jiggle or not b.jiggle_enable: #if not jiggle enabled, it not it the list so this seems pointless?
+            b.jiggle_last_mat=b.id_data.matrix_world @ b.matrix
                     
-def reset_jiggle_tree(jiggle_tree, ob=None):
-    if bpy.context.scene.jiggle_enable:
-        for item in jiggle_tree:
-            if 'bones' in jiggle_tree[item]:
-                #process objects
-                if item in bpy.data.objects:
-                    reset_jiggle_tree(jiggle_tree[item]['bones'], bpy.data.objects[item])
-                    reset_jiggle_tree(jiggle_tree[item]['children'])
-                else:
-                    generate_jiggle_tree()
-            else:
-                #process bones
-                if item in ob.pose.bones:
-                    b = ob.pose.bones[item]
-                    reset_bone(b)
-                    reset_jiggle_tree(jiggle_tree[item]['children'], ob)
-                else:
-                    generate_jiggle_tree()
+def reset_jiggle_tree(jiggle_tree):
+    if jiggle_scene().jiggle_enable:
+        if any(item not in bpy.data.objects for item, node in jiggle_tree_items(jiggle_tree)):
+            generate_jiggle_tree()
+            jiggle_tree = get_jiggle_tree(jiggle_scene())
+        seed_jiggle_state(jiggle_scene(), dict.fromkeys(item for item, node in jiggle_tree_items(jiggle_tree)))
                     
-@persistent
-def jiggle_pre(self):
-    global curframe
+#the frame handlers solve each (scene, frame) once. other view layers of that frame, and other
+#scenes sharing the same armatures at the same frame, reapply the stored result instead.
+def store_jiggle_result(ob, plan):
+    scene = jiggle_scene()
+    jiggle_results[ob.name] = {
+        'pose': ob.pose.as_pointer(),
+        'scene': scene.name,
+        'frame': scene.frame_current,
+        'basis': pose_bone_array(ob, 'matrix_basis', 16)[plan['indices']],
+    }
+
+def stored_jiggle_result(ob, plan):
+    result = jiggle_results.get(ob.name)
+    if (result and result['pose'] == ob.pose.as_pointer() and len(result['basis']) == len(plan['indices'])
+        and result['frame'] == jiggle_scene().frame_current):
+        return result
+    return None
 
+#result of this frame solved by another scene that is still on that frame
+def shared_jiggle_result(ob, plan):
+    result = stored_jiggle_result(ob, plan)
+    if result and result['scene'] != jiggle_scene().name and solved_frames.get(result['scene']) == result['frame']:
+        return result
+    return None
+
+def apply_jiggle_result(ob, plan, result):
+    values = pose_bone_array(ob, 'matrix_basis', 16)
+    values[plan['indices']] = result['basis']
+    ob.pose.bones.foreach_set('matrix_basis', values.ravel())
+
+def reuse_jiggle_tree(jiggle_tree):
+    if jiggle_scene().jiggle_enable:
+        for ob, bones in jiggle_tree_objects(jiggle_tree):
+            plan = get_jiggle_plan(ob, bones)
+            result = stored_jiggle_result(ob, plan)
+            if result:
+                apply_jiggle_result(ob, plan, result)
+
+######## RESET AND SEED ########################################################################
+#resetting or seeding armatures replaces their whole simulation state in bulk and then evaluates the
+#scene once. seeding happens inside that evaluation, after the pre pass has put the seeded armatures
+#back to their animated pose, while every other armature keeps the pose of its last solve.
+
+#states maps armature names to a capture_jiggle_state snapshot, or None to start at rest from the
+#animated pose of the current frame
+def seed_jiggle_state(scene, states):
+    for name in states:
+        jiggle_plans.pop(name, None) #recompiled with fresh parent offsets on the next access
+        for cache in (chain_state, jiggle_results, watch_state, jiggle_offsets, deferred_frames):
+            cache.pop(name, None)
+        idle_armatures.discard(name)
+    instance_history.clear()
+    instance_leaders.clear()
+    jiggle_checkpoints.clear()
+    seed_states.update(states)
     try:
-        jiggle_tree = bpy.context.scene['jiggle_tree'].to_dict()
-    except:
+        scene.frame_set(scene.frame_current)
+    finally:
+        seed_states.clear()
+
+#springs at rest and previous frame matrices of the current pose, for every plan bone at once
+def pose_jiggle_state(ob, plan):
+    mats = np.array(ob.matrix_world) @ pose_bone_array(ob, 'matrix', 16)[plan['indices']].reshape(-1,4,4).transpose(0,2,1)
+    values = np.zeros((len(plan['names']), state_size))
+    values[:,12:28] = values[:,28:44] = mats.reshape(-1,16)
+    rot = mats[:,:3,:3] / np.maximum(np.linalg.norm(mats[:,:3,:3], axis=1), 1e-12)[:,None,:]
+    values[:,44:48] = matrix_quaternions(rot)
+    return {'bones': values, 'chain': None}
+
+def seed_jiggle_tree(jiggle_tree):
+    for ob, bones in jiggle_tree_objects(jiggle_tree):
+        plan = get_jiggle_plan(ob, bones)
+        if ob.name in seed_states:
+            state = seed_states.pop(ob.name)
+            restore_jiggle_state(ob, plan, state if state is not None else pose_jiggle_state(ob, plan))
+        else:
+            result = stored_jiggle_result(ob, plan)
+            if result:
+                apply_jiggle_result(ob, plan, result)
+        store_jiggle_result(ob, plan)
+
+#instances of a rig playing the same animation with the same parameters and motion, offset only in
+#world location, solve identically. an armature's fingerprint chains its inputs of every frame since
+#the last reset, so equal fingerprints mean equal state and the first armature solves for all of them.
+def fingerprint_bytes(values):
+    return (np.round(values, 6) + 0.0).tobytes() #+0.0 folds -0.0 into 0.0
+
+def instance_fingerprint(ob, plan, restart):
+    last = instance_history.get(ob.name)
+    mw = np.array(ob.matrix_world, dtype=np.float64)
+    if restart:
+        sig, moved = 0, np.zeros(3)
+    elif last:
+        sig, moved = last['sig'], mw[:3,3] - last['location']
+    else:
+        sig, moved = zlib.crc32(ob.name.encode()), np.zeros(3) #unknown history, solve alone until a reset
+    sig = armature_params_signature(ob, plan, sig)
+    sig = zlib.crc32(fingerprint_bytes(mw[:3,:3]), sig)
+    sig = zlib.crc32(fingerprint_bytes(moved), sig)
+    sig = zlib.crc32(fingerprint_bytes(pose_bone_array(ob, 'matrix', 16)[plan['indices']]), sig)
+    instance_history[ob.name] = {'sig': sig, 'location': mw[:3,3]}
+    return sig
+
+#group the tree's armatures by fingerprint before solving a frame
+def share_instances(jiggle_tree):
+    scene = jiggle_scene()
+    if not scene.jiggle_share_instances:
+        for name in list(instance_leaders):
+            sync_instance_state(name)
+        instance_history.clear()
+        return
+    restart = skip_jiggle or ((scene.frame_current == scene.frame_start) and scene.jiggle_reset)
+    leaders = {}
+    followers = {}
+    for ob, bones in jiggle_tree_objects(jiggle_tree):
+        plan = get_jiggle_plan(ob, bones)
+        #the fingerprint doesn't cover pushes that depend on world position, an armature in a field or
+        #near a collider solves alone until the next reset
+        if ob.name in idle_armatures or ob.name in field_forces or colliders_near(ob, plan):
+            instance_history.pop(ob.name, None)
+            continue
+        leader = leaders.setdefault(instance_fingerprint(ob, plan, restart), ob)
+        if leader != ob:
+            followers[ob.name] = (leader.name, np.array(ob.matrix_world.translation - leader.matrix_world.translation))
+    #followers that diverge take over the state they shared, nothing of this frame is solved yet
+    for name, follow in list(instance_leaders.items()):
+        if followers.get(name, (None,))[0] != follow[0]:
+            sync_instance_state(name)
+    instance_leaders.clear()
+    instance_leaders.update(followers)
+
+#a follower's own state props are stale, its state is the leader's moved by their world offset
+def instance_state(name):
+    leader, offset = instance_leaders[name]
+    if name not in jiggle_plans or leader not in jiggle_plans or leader not in bpy.data.objects:
+        return None
+    state = capture_jiggle_state(bpy.data.objects[leader], jiggle_plans[leader])
+    values = state['bones'].copy()
+    for col in (15, 19, 23, 31, 35, 39): #translation of jiggle_mat and t1
+        values[:,col] += offset[(col - 15) % 16 // 4]
+    chain = {k: v + offset for k, v in state['chain'].items()} if state['chain'] else None
+    return {'bones': values, 'chain': chain}
+
+#a follower leaving its group takes over the state it shared and solves alone until the next reset
+def sync_instance_state(name):
+    state = instance_state(name)
+    if state:
+        restore_jiggle_state(bpy.data.objects[name], jiggle_plans[name], state)
+    instance_leaders.pop(name)
+    instance_history.pop(name, None) #unknown history, see instance_fingerprint
+
+def instance_result(ob):
+    follow = instance_leaders.get(ob.name)
+    if follow:
+        result = jiggle_results.get(follow[0])
+        if result and result['frame'] == jiggle_scene().frame_current:
+            return result
+        sync_instance_state(ob.name) #leader wasn't solved, solve alone
+    return None
+
+#armature nodes of the tree, parents before their children
+def jiggle_tree_items(jiggle_tree):
+    stack = list(reversed(list(jiggle_tree.items())))
+    while stack:
+        item, node = stack.pop()
+        yield item, node
+        stack.extend(reversed(list(node['children'].items())))
+
+def jiggle_tree_objects(jiggle_tree):
+    for item, node in jiggle_tree_items(jiggle_tree):
+        if item in bpy.data.objects:
+            yield bpy.data.objects[item], node['bones']
+
+#simulation state carried from frame to frame, one row per plan bone: spring, velocity, spring2,
+#velocity2 (3 each), jiggle_last_mat, jiggle_last_anim (16 each, row major), jiggle_last_rot (4)
+state_props = (('jiggle_spring', 3), ('jiggle_velocity', 3), ('jiggle_spring2', 3), ('jiggle_velocity2', 3),
+               ('jiggle_last_mat', 16), ('jiggle_last_anim', 16), ('jiggle_last_rot', 4))
+state_size = 48
+
+def capture_jiggle_state(ob, plan):
+    if ob.name in instance_leaders:
+        state = instance_state(ob.name) #still following, capturing doesn't leave the group
+        if state:
+            return state
+        sync_instance_state(ob.name)
+    idx = plan['indices']
+    values = np.empty((len(idx), state_size))
+    col = 0
+    for prop, width in state_props:
+        column = pose_bone_array(ob, prop, width)[idx]
+        if width == 16: #matrix properties are column major
+            column = column.reshape(-1,4,4).transpose(0,2,1).reshape(-1,16)
+        values[:,col:col+width] = column
+        col += width
+    chain = chain_state.get(ob.name)
+    return {
+        'bones': values,
+        'chain': {k: v.copy() for k, v in chain.items()} if chain else None,
+    }
+
+def restore_jiggle_state(ob, plan, state):
+    idx = plan['indices']
+    values = state['bones']
+    col = 0
+    for prop, width in state_props:
+        column = values[:,col:col+width]
+        if width == 16:
+            column = column.reshape(-1,4,4).transpose(0,2,1).reshape(-1,16)
+        current = pose_bone_array(ob, prop, width)
+        current[idx] = column
+        ob.pose.bones.foreach_set(prop, current.ravel())
+        col += width
+    if state['chain']:
+        chain_state[ob.name] = {k: v.copy() for k, v in state['chain'].items()}
+    else:
+        chain_state.pop(ob.name, None)
+
+def capture_tree_state(jiggle_tree):
+    return {ob.name: capture_jiggle_state(ob, get_jiggle_plan(ob, bones)) for ob, bones in jiggle_tree_objects(jiggle_tree)}
+
+#largest change of spring, velocity and previous matrix state between two tree snapshots
+def tree_state_delta(state1, state2):
+    delta = 0.0
+    for name in state2:
+        if not name in state1 or state1[name]['bones'].shape != state2[name]['bones'].shape:
+            return math.inf
+        if len(state2[name]['bones']):
+            delta = max(delta, np.abs(state1[name]['bones'][:,:28] - state2[name]['bones'][:,:28]).max())
+    return delta
+
+#steady state of a looping range is kept on the armature object so it's saved with the file
+def store_loop_state(jiggle_tree, state, frame_range):
+    for ob, bones in jiggle_tree_objects(jiggle_tree):
+        ob_state = state[ob.name]
+        ob['jiggle_loop_state'] = {
+            'range': frame_range,
+            'bones': ob_state['bones'].ravel().tolist(),
+            'chain': {k: v.ravel().tolist() for k, v in ob_state['chain'].items()} if ob_state['chain'] else {},
+        }
+
+#seed all armatures from their stored steady state, as if the previous frame was the end of the loop
+def seed_loop_state(jiggle_tree, frame_range):
+    seeded = False
+    instance_history.clear()
+    instance_leaders.clear()
+    for ob, bones in jiggle_tree_objects(jiggle_tree):
+        plan = get_jiggle_plan(ob, bones)
+        stored = ob.get('jiggle_loop_state')
+        if not stored or tuple(stored['range']) != frame_range:
+            continue
+        values = np.array(stored['bones']).reshape(-1, state_size)
+        if len(values) != len(plan['names']):
+            continue
+        chain = {k: np.array(v).reshape(-1, 3) for k, v in stored['chain'].items()} or None
+        restore_jiggle_state(ob, plan, {'bones': values, 'chain': chain})
+        seeded = True
+    return seeded
+
+#sparse checkpoints of the whole tree state every jiggle_checkpoint_interval frames, so scrubbing
+#only resimulates from the nearest earlier checkpoint, at most jiggle_checkpoint_max_gap frames back.
+#least recently used checkpoints are dropped once the cache outgrows jiggle_checkpoint_budget.
+param_props = ('jiggle_stiffness', 'jiggle_dampen', 'jiggle_amplitude', 'jiggle_translation', 'jiggle_stretch', 'jiggle_gravity', 'jiggle_force')
+
+#checkpoints are only valid for the settings they were simulated with
+def jiggle_params_signature(jiggle_tree):
+    scene = jiggle_scene()
+    sig = zlib.crc32(('%s %s %f' %(scene.jiggle_solver, scene.jiggle_integrator, scene.jiggle_rate)).encode())
+    for ob, bones in jiggle_tree_objects(jiggle_tree):
+        sig = armature_params_signature(ob, get_jiggle_plan(ob, bones), zlib.crc32(ob.name.encode(), sig))
+    return sig
+
+def armature_params_signature(ob, plan, sig=0):
+    sig = zlib.crc32('\n'.join(plan['names']).encode(), sig)
+    for prop in param_props:
+        sig = zlib.crc32(param_array(ob, plan, prop).tobytes(), sig)
+    return zlib.crc32(param_array(ob, plan, 'jiggle_active').tobytes(), sig)
+
+######## PARAMETER PREFETCH ####################################################################
+#bakes and cache fills evaluate the animated jiggle parameters of their whole range up front. per
+#armature a parameter is either one value per plan bone, or a (frames, bones) table when any of its
+#bones has keys. both solvers read parameters through bone_params and param_array, which fall back
+#to the pose bones outside a prefetched range.
+prefetch_props = param_props + ('jiggle_active', 'jiggle_collision', 'jiggle_collision_margin', 'jiggle_collision_friction')
+bool_props = ('jiggle_active', 'jiggle_collision')
+
+#drivers and nla strips change parameters in ways the action's curves don't show
+def params_prefetchable(ob):
+    ad = ob.animation_data
+    if not ad:
+        return True
+    if any(not track.mute and track.strips for track in ad.nla_tracks):
+        return False
+    return not any(fc.data_path.rsplit('.', 1)[-1] in prefetch_props for fc in ad.drivers)
+
+def prefetch_jiggle_params(jiggle_tree, frame_start, frame_end):
+    param_tables.clear()
+    frames = range(frame_start, frame_end + 1)
+    for ob, bones in jiggle_tree_objects(jiggle_tree):
+        if not params_prefetchable(ob):
+            continue
+        plan = get_jiggle_plan(ob, bones)
+        action = ob.animation_data.action if ob.animation_data else None
+        curves = {fc.data_path: fc for fc in action.fcurves if not fc.mute} if action else {}
+        paths = [ob.pose.bones[name].path_from_id() + '.' for name in plan['names']]
+        values = {}
+        for prop in prefetch_props:
+            dtype = bool if prop in bool_props else np.float32
+            static = pose_bone_array(ob, prop, dtype=dtype)[plan['indices']]
+            keyed = [(i, curves[path + prop]) for i, path in enumerate(paths) if path + prop in curves]
+            if not keyed:
+                values[prop] = static
+                continue
+            table = np.repeat(static[None], len(frames), axis=0)
+            for i, fc in keyed:
+                samples = np.array([fc.evaluate(frame) for frame in frames], dtype=np.float32)
+                table[:,i] = samples >= 0.5 if dtype is bool else samples #animated booleans switch at 0.5
+            values[prop] = table
+        param_tables[ob.name] = {
+            'start': frame_start,
+            'end': frame_end,
+            'bones': {name: i for i, name in enumerate(plan['names'])},
+            'values': values,
+            'row': (None, None),
+        }
+
+#parameters of the current frame for all plan bones, None outside a prefetched range
+def frame_params(ob):
+    table = param_tables.get(ob.name)
+    frame = jiggle_scene().frame_current
+    if not table or not table['start'] <= frame <= table['end']:
+        return None
+    if table['row'][0] != frame:
+        row = {prop: v[frame - table['start']] if v.ndim == 2 else v for prop, v in table['values'].items()}
+        table['row'] = (frame, row)
+    return table['row'][1]
+
+#one parameter of every plan bone
+def param_array(ob, plan, prop):
+    row = frame_params(ob)
+    if row is not None:
+        return row[prop]
+    return pose_bone_array(ob, prop, dtype=bool if prop in bool_props else np.float32)[plan['indices']]
+
+#all parameters of one bone as python values, for the per bone solver
+def bone_params(b):
+    row = frame_params(b.id_data)
+    if row is None:
+        return {prop: getattr(b, prop) for prop in prefetch_props}
+    i = param_tables[b.id_data.name]['bones'][b.name]
+    return {prop: values[i].item() for prop, values in row.items()}
+
+def checkpoint_size(checkpoint):
+    size = 0
+    for name, state in checkpoint['state'].items():
+        size += state['bones'].nbytes + checkpoint['basis'][name].nbytes
+        if state['chain']:
+            size += sum(v.nbytes for v in state['chain'].values())
+    return size
+
+def store_checkpoint(scene, jiggle_tree, frame):
+    interval = scene.jiggle_checkpoint_interval
+    if not interval or (frame - scene.frame_start) % interval:
+        return
+    basis = {}
+    for ob, bones in jiggle_tree_objects(jiggle_tree):
+        basis[ob.name] = pose_bone_array(ob, 'matrix_basis', 16)[get_jiggle_plan(ob, bones)['indices']]
+    checkpoint = {
+        'state': capture_tree_state(jiggle_tree),
+        'basis': basis,
+        'params': jiggle_params_signature(jiggle_tree),
+    }
+    checkpoint['size'] = checkpoint_size(checkpoint)
+    key = (scene.name, frame)
+    jiggle_checkpoints.pop(key, None)
+    jiggle_checkpoints[key] = checkpoint
+    
+    budget = scene.jiggle_checkpoint_budget * 1024 * 1024
+    total = sum(c['size'] for c in jiggle_checkpoints.values())
+    while total > budget and jiggle_checkpoints:
+        total -= jiggle_checkpoints.popitem(last=False)[1]['size']
+
+#nearest checkpoint at or before frame as (frame, checkpoint)
+def nearest_checkpoint(scene, jiggle_tree, frame):
+    if not scene.jiggle_checkpoint_interval or not jiggle_checkpoints:
+        return None
+    sig = jiggle_params_signature(jiggle_tree)
+    best = None
+    earliest = frame - scene.jiggle_checkpoint_max_gap #farther jumps reset instead of stalling the handler
+    for (name, f), checkpoint in jiggle_checkpoints.items():
+        if name == scene.name and earliest <= f <= frame and checkpoint['params'] == sig and (best is None or f > best[0]):
+            best = (f, checkpoint)
+    if best:
+        jiggle_checkpoints.move_to_end((scene.name, best[0]))
+    return best
+
+def restore_checkpoint(jiggle_tree, checkpoint, apply_pose=False):
+    instance_history.clear()
+    instance_leaders.clear()
+    for ob, bones in jiggle_tree_objects(jiggle_tree):
+        if ob.name in checkpoint['state']:
+            plan = get_jiggle_plan(ob, bones)
+            restore_jiggle_state(ob, plan, checkpoint['state'][ob.name])
+            if apply_pose:
+                apply_jiggle_result(ob, plan, {'basis': checkpoint['basis'][ob.name]})
+                store_jiggle_result(ob, plan)
+
+#scene currently evaluated by the frame handlers, everything else works on the context scene
+def jiggle_scene():
+    return eval_scene or bpy.context.scene
+
+@persistent
+def jiggle_pre(scene):
+    global eval_scene
+    last_scene = eval_scene
+    eval_scene = scene
+    if solved_frames.get(scene.name) == scene.frame_current and not seed_states:
+        #another view layer or render pass of a solved frame, post reapplies its result over the pose
+        eval_scene = last_scene
+        return
+
+    if not 'jiggle_tree' in scene:
         generate_jiggle_tree()
-        jiggle_tree = bpy.context.scene['jiggle_tree'].to_dict()
+    jiggle_tree = get_jiggle_tree(scene)
         
     jiggle_tree_pre(jiggle_tree)
-            
-            
+    eval_scene = last_scene
 
 @persistent
-def jiggle_post(self,depsgraph):
-    global curframe 
+def jiggle_post(scene,depsgraph):
     global render
     global skip_handler
     global skip_jiggle
-    #print("%s %s" %(depsgraph.view_layer.name, bpy.context.view_layer.name))
+    global catchup_frames
+    global eval_scene
     if (skip_handler):
         return
     skip_handler = True
-    if (depsgraph.view_layer.name == bpy.context.view_layer.name):
-        bpy.context.scene.frame_set(bpy.context.scene.frame_current)
-                
-        if bpy.context.screen.is_animation_playing and curframe and (abs(bpy.context.scene.frame_current - curframe) > 10):
-            if (abs(bpy.context.scene.frame_current - curframe) > (bpy.context.scene.frame_end - bpy.context.scene.frame_start - 10)) and not bpy.context.scene.jiggle_reset:
+    last_scene = eval_scene
+    eval_scene = scene
+    frame = scene.frame_current
+    jiggle_tree = get_jiggle_tree(scene)
+    
+    if seed_states:
+        #reset or seed, see seed_jiggle_state. checked first, the seeded frame may already be solved
+        scene.frame_set(frame)
+        seed_jiggle_tree(jiggle_tree)
+        curframes[scene.name] = frame
+        solved_frames[scene.name] = frame
+    elif solved_frames.get(scene.name) == frame:
+        #another view layer of a frame that's already solved
+        reuse_jiggle_tree(jiggle_tree)
+    else:
+        scene.frame_set(frame)
+        
+        playing = bpy.context.screen is not None and bpy.context.screen.is_animation_playing
+        curframe = curframes.get(scene.name)
+        catchup_frames = 1
+        if playing and curframe and (abs(frame - curframe) > 10):
+            if (abs(frame - curframe) > (scene.frame_end - scene.frame_start - 10)) and not scene.jiggle_reset:
                 print('looping')
                 skip_jiggle = False
+            elif 0 < frame - curframe <= scene.jiggle_catchup_frames:
+                skip_jiggle = False
+                catchup_frames = frame - curframe
+                print('anim drop, catching up %d frames' %catchup_frames)
             else:
                 skip_jiggle = True
                 print('anim drop')
-        elif (bpy.context.screen.is_animation_playing == False) and curframe and (bpy.context.scene.frame_current != curframe+1):
+        elif (playing == False) and curframe and (frame != curframe+1):
             skip_jiggle = True
             #print('scrubbing')
         else:
             skip_jiggle = False
             #print('jiggling')
-            #print(bpy.context.screen.is_animation_playing)
+            if playing and curframe and 1 < frame - curframe <= scene.jiggle_catchup_frames:
+                catchup_frames = frame - curframe
             
-        curframe = bpy.context.scene.frame_current
-        #print("post %d %d" %(curframe, bpy.context.scene.frame_current))
+        if (skip_jiggle and frame == scene.frame_start and scene.jiggle_loop_seamless and not scene.jiggle_reset
+            and seed_loop_state(jiggle_tree, (scene.frame_start, scene.frame_end))):
+            skip_jiggle = False
+            print('loop seeded')
+        
+        checkpoint = None
+        if skip_jiggle and not playing:
+            checkpoint = nearest_checkpoint(scene, jiggle_tree, frame)
             
-        jiggle_tree = bpy.context.scene['jiggle_tree'].to_dict()
-        jiggle_tree_post2(jiggle_tree) 
+        curframes[scene.name] = frame
+        
+        if checkpoint and checkpoint[0] == frame:
+            restore_checkpoint(jiggle_tree, checkpoint[1], apply_pose=True)
+        else:
+            if checkpoint:
+                #scrubbing, resimulate from the nearest earlier checkpoint instead of resetting
+                restore_checkpoint(jiggle_tree, checkpoint[1])
+                skip_jiggle = False
+                prefetch = not param_tables #a bake or loop solve already prefetched its range
+                if prefetch:
+                    prefetch_jiggle_params(jiggle_tree, checkpoint[0] + 1, frame)
+                try:
+                    for f in range(checkpoint[0] + 1, frame):
+                        scene.frame_set(f)
+                        solve_jiggle_tree(jiggle_tree, depsgraph)
+                        store_checkpoint(scene, jiggle_tree, f)
+                    scene.frame_set(frame)
+                    solve_jiggle_tree(jiggle_tree, depsgraph)
+                finally:
+                    if prefetch:
+                        param_tables.clear()
+            else:
+                solve_jiggle_tree(jiggle_tree, depsgraph)
+            if (not skip_jiggle or (frame == scene.frame_start and scene.jiggle_reset)) and not (deferred_armatures or budget_substeps):
+                store_checkpoint(scene, jiggle_tree, frame) #only full quality solves
+        catchup_frames = 1
+        solved_frames[scene.name] = frame
+    eval_scene = last_scene
     skip_handler = False     
                 
 ######## NEW STUFF ENDS #######################################################################
         
+#edited animation makes every checkpoint stale, moved objects can't be skipped as idle
+@persistent
+def jiggle_depsgraph_update(scene, depsgraph):
+    for update in depsgraph.updates:
+        if isinstance(update.id, bpy.types.Action):
+            jiggle_checkpoints.clear()
+            animated_armatures.clear()
+            solved_frames.clear() #the solved frame no longer matches its animation
+            for name in list(jiggle_plans):
+                if name in bpy.data.objects:
+                    refresh_parent_offsets(bpy.data.objects[name])
+        elif isinstance(update.id, bpy.types.Armature):
+            #bone settings such as inherit rotation or scale
+            for name in list(jiggle_plans):
+                if name in bpy.data.objects and bpy.data.objects[name].data == update.id.original:
+                    refresh_parent_offsets(bpy.data.objects[name])
+        elif isinstance(update.id, bpy.types.Object):
+            ob = update.id.original
+            if ob.field and ob.field.type in field_types:
+                field_objects.clear() #the field type may be new
+            if ob.jiggle_collider_enable or (ob.field and ob.field.type in field_types):
+                moved_objects.add(ob.name) #collider or field settings edits count as moves, see armature_idle
+            if update.is_updated_transform:
+                moved_objects.add(update.id.original.name)
+                solved_frames.clear()
+                if update.id.original.name in jiggle_plans:
+                    refresh_parent_offsets(update.id.original) #constraint edits tag the transform
+            if update.is_updated_geometry:
+                if ob.name in jiggle_plans:
+                    refresh_rotation_modes(ob)
+                sdf_grids.pop(update.id.original.name, None)
+                collider_cache.pop(update.id.original.name, None)
+
+#forget every per scene and per armature cache, for a newly loaded file or a fresh test rig
+def clear_jiggle_caches():
+    global budget_substeps, catchup_frames, skip_jiggle
+    for cache in (curframes, solved_frames, jiggle_results, jiggle_checkpoints, moved_objects, animated_armatures,
+                  idle_armatures, watch_state, jiggle_plans, jiggle_trees, chain_state, instance_history,
+                  instance_leaders, chain_jobs, solve_costs, deferred_armatures, deferred_frames, jiggle_offsets,
+                  field_forces, field_objects, jiggle_colliders, collider_cache, sdf_grids, param_tables, seed_states):
+        cache.clear()
+    budget_substeps = 0
+    catchup_frames = 1
+    skip_jiggle = False
+
+#compile plans from the armatures' topology records so the first frame doesn't regenerate anything
+@persistent
+def jiggle_load_post(self):
+    global eval_scene
+    clear_jiggle_caches()
+    prune_sdf_files()
+    for scene in bpy.data.scenes:
+        if 'jiggle_tree' in scene:
+            eval_scene = scene
+            for ob, bones in jiggle_tree_objects(get_jiggle_tree(scene)):
+                get_jiggle_plan(ob, bones)
+    eval_scene = None
+
 @persistent
 def jiggle_render(self):
     global render
@@ -870,10 +2661,9 @@ def render_post(self):
     global render
     render = False
 
-def select_bones(bone_tree, ob):
-    for bone in bone_tree:
-        ob.pose.bones[bone].bone.select = True
-        select_bones(bone_tree[bone]['children'], ob)
+def select_bones(plan, ob):
+    for name in plan['names']:
+        ob.pose.bones[name].bone.select = True
 
 class reset_wiggle(bpy.types.Operator):
     """Reset wiggle physics"""
@@ -885,7 +2675,7 @@ class reset_wiggle(bpy.types.Operator):
         return True
     
     def execute(self,context):
-        jiggle_tree = bpy.context.scene['jiggle_tree'].to_dict()
+        jiggle_tree = get_jiggle_tree(context.scene)
         reset_jiggle_tree(jiggle_tree)   
         return {'FINISHED'}
 
@@ -901,13 +2691,313 @@ class select_wiggle_bones(bpy.types.Operator):
     def execute(self,context):
         bpy.ops.pose.select_all(action='DESELECT')
         ob = context.object
-        jiggle_tree = bpy.context.scene['jiggle_tree'].to_dict()
-        if ob.name in jiggle_tree:
-            select_bones(jiggle_tree[ob.name]['bones'], ob)     
+        plan = jiggle_armature_plan(context.scene, ob)
+        if plan:
+            select_bones(plan, ob)
         return {'FINISHED'}
         
+class solve_wiggle_loop(bpy.types.Operator):
+    """Simulate the frame range as a loop until the jiggle settles, and use that state when the loop starts"""
+    bl_idname = "id.solve_wiggle_loop"
+    bl_label = "Solve Seamless Loop"
+    
+    @classmethod
+    def poll(cls,context):
+        return True
+    
+    def execute(self,context):
+        scene = context.scene
+        jiggle_tree = get_jiggle_tree(scene)
+        frame_range = (scene.frame_start, scene.frame_end)
+        reset = scene.jiggle_reset
+        scene.jiggle_reset = False
+        prefetch = not param_tables #a bake already prefetched its range
+        if prefetch:
+            prefetch_jiggle_params(jiggle_tree, *frame_range)
+        
+        last = None
+        cycle = 0
+        delta = math.inf
+        try:
+            while cycle < scene.jiggle_loop_cycles and delta > scene.jiggle_loop_tolerance:
+                for frame in range(scene.frame_start, scene.frame_end + 1):
+                    curframes[scene.name] = frame - 1 #play the range as one continuous loop
+                    scene.frame_set(frame)
+                state = capture_tree_state(jiggle_tree)
+                if last:
+                    delta = tree_state_delta(last, state)
+                last = state
+                cycle += 1
+        finally:
+            if prefetch:
+                param_tables.clear()
+            scene.jiggle_reset = reset
+        
+        store_loop_state(jiggle_tree, last, frame_range)
+        if delta > scene.jiggle_loop_tolerance:
+            self.report({'WARNING'}, 'Loop did not settle after %d cycles' %cycle)
+        else:
+            self.report({'INFO'}, 'Loop settled after %d cycles' %cycle)
+        return {'FINISHED'}
+
+#baked keys are thinned to the fewest linear keys that stay within the tolerance of the baked values.
+#douglas-peucker on all curves at once: every pass splits each segment at its worst frame.
+def decimate_keys(frames, values, tolerance):
+    n = values.shape[1]
+    idx = np.arange(n)
+    rows = np.arange(len(values))[:,None]
+    keep = np.zeros(values.shape, dtype=bool)
+    keep[:,[0,-1]] = True
+    while True:
+        prev = np.maximum.accumulate(np.where(keep, idx, 0), axis=1)
+        after = np.minimum.accumulate(np.where(keep, idx, n-1)[:,::-1], axis=1)[:,::-1]
+        w = (frames - frames[prev]) / np.maximum(frames[after] - frames[prev], 1e-9)
+        v0 = values[rows, prev]
+        error = np.abs(v0 + (values[rows, after] - v0)*w - values)
+        error[error <= tolerance[:,None]] = 0
+        if not error.any():
+            return keep
+        #worst frame of every segment, segments are runs of equal (row, prev)
+        key = (rows*n + prev).ravel()
+        start = np.flatnonzero(np.diff(key, prepend=-1))
+        segment = np.cumsum(np.diff(key, prepend=-1) != 0) - 1
+        worst = np.maximum.reduceat(error.ravel(), start)[segment]
+        keep |= ((error.ravel() == worst) & (worst > 0)).reshape(keep.shape)
+
+#value a channel has without keys, and the tolerance of its values
+def channel_default(fc):
+    channel = fc.data_path.rsplit('.', 1)[-1]
+    if channel == 'scale' or (channel, fc.array_index) in (('rotation_quaternion', 0), ('rotation_axis_angle', 2)):
+        return 1.0
+    return 0.0
+
+def channel_tolerance(fc, angle, distance):
+    channel = fc.data_path.rsplit('.', 1)[-1]
+    if channel == 'rotation_quaternion':
+        return angle / 2 #components move by about half the rotation angle
+    if channel.startswith('rotation'):
+        return angle
+    return distance
+
+#empty curve in place of any existing one
+def new_fcurve(action, data_path, index, group):
+    fc = action.fcurves.find(data_path, index=index)
+    if fc:
+        action.fcurves.remove(fc)
+    return action.fcurves.new(data_path, index=index, action_group=group)
+
+#add keys after the last one in one bulk write, the curve needs an update once all keys are in
+def append_keys(fc, frames, values):
+    points = fc.keyframe_points
+    count = len(points)
+    co = np.empty((count + len(frames)) * 2, dtype=np.float32)
+    points.foreach_get('co', co[:count*2])
+    co[count*2:] = np.column_stack((frames, values)).ravel()
+    points.add(len(frames))
+    points.foreach_set('co', co)
+
+#replace a curve's keys in one bulk write
+def write_fcurve(action, data_path, index, group, frames, values, interpolation=None):
+    fc = new_fcurve(action, data_path, index, group)
+    append_keys(fc, frames, values)
+    if interpolation:
+        for k in fc.keyframe_points:
+            k.interpolation = interpolation
+    fc.update()
+
+def decimate_action(action, angle, distance, data_paths, batch=64):
+    curves = {} #baked curves grouped by their key frames
+    for fc in action.fcurves:
+        if fc.data_path in data_paths and len(fc.keyframe_points) > 2:
+            co = np.empty(len(fc.keyframe_points)*2)
+            fc.keyframe_points.foreach_get('co', co)
+            co = co.reshape(-1, 2)
+            curves.setdefault(co[:,0].tobytes(), []).append((fc, co[:,1]))
+    before = after = 0
+    #batches of curves keep the temporaries of decimate_keys small on long shots
+    batches = [(np.frombuffer(key), group[i:i+batch]) for key, group in curves.items() for i in range(0, len(group), batch)]
+    for frames, group in batches:
+        values = np.array([v for fc, v in group])
+        tolerance = np.array([channel_tolerance(fc, angle, distance) for fc, v in group])
+        keep = decimate_keys(frames, values, tolerance)
+        static = np.ptp(values, axis=1) <= tolerance
+        before += values.size
+        for i, (fc, v) in enumerate(group):
+            if static[i] and abs(v[0] - channel_default(fc)) <= tolerance[i]:
+                action.fcurves.remove(fc) #never moves away from its unkeyed value
+                continue
+            kept = keep[i] if not static[i] else np.arange(len(v)) == 0 #held value, one key
+            write_fcurve(action, fc.data_path, fc.array_index, fc.group.name if fc.group else '', frames[kept], v[kept], 'LINEAR')
+            after += kept.sum()
+    print('decimated %d baked keys to %d' %(before, after))
+
+#plan of one armature of the scene's jiggle tree, None if it has no jiggle bones
+def jiggle_armature_plan(scene, ob):
+    if 'jiggle_tree' not in scene:
+        return None
+    for item, bones in jiggle_tree_objects(get_jiggle_tree(scene)):
+        if item == ob:
+            return get_jiggle_plan(ob, bones)
+    return None
+
+#the bake covers the armature's jiggle bones, not the selection
+def jiggle_bake_bones(scene, ob):
+    plan = jiggle_armature_plan(scene, ob)
+    return [ob.pose.bones[name] for name in plan['names']] if plan else []
+
+#channels jiggle can change on a bone: rotation always, location and scale only when translation or stretch move them
+def jiggle_bake_channels(b):
+    if b.rotation_mode == 'QUATERNION':
+        channels = ['rotation_quaternion']
+    elif b.rotation_mode == 'AXIS_ANGLE':
+        channels = ['rotation_axis_angle']
+    else:
+        channels = ['rotation_euler']
+    if b.jiggle_translation and not b.bone.use_connect:
+        channels.append('location')
+    if b.jiggle_stretch:
+        channels.append('scale')
+    return channels
+
+bake_channel_widths = {'location': 3, 'scale': 3, 'rotation_quaternion': 4, 'rotation_euler': 3, 'rotation_axis_angle': 4}
+
+#visual keying of the jiggle channels as a stream of chunks, yields each chunk's frames and per bone
+#channel values. the last sample of every channel carries over so rotations stay continuous.
+def jiggle_bake_chunks(scene, ob, bones, chunk):
+    channels = [jiggle_bake_channels(b) for b in bones]
+    last = [dict.fromkeys(chans) for chans in channels]
+    for start in range(scene.frame_start, scene.frame_end + 1, chunk):
+        frames = np.arange(start, min(start + chunk, scene.frame_end + 1), dtype=np.float32)
+        samples = [{channel: np.empty((len(frames), bake_channel_widths[channel]), dtype=np.float32) for channel in chans} for chans in channels]
+        for row, frame in enumerate(frames):
+            scene.frame_set(int(frame))
+            for b, sample, prev in zip(bones, samples, last):
+                loc, rot, scale = ob.convert_space(pose_bone=b, matrix=b.matrix, from_space='POSE', to_space='LOCAL').decompose()
+                for channel, values in sample.items():
+                    if channel == 'location':
+                        value = loc
+                    elif channel == 'scale':
+                        value = scale
+                    elif channel == 'rotation_quaternion':
+                        if prev[channel] is not None:
+                            rot.make_compatible(prev[channel])
+                        value = rot
+                    elif channel == 'rotation_euler':
+                        value = rot.to_euler(b.rotation_mode, prev[channel]) if prev[channel] is not None else rot.to_euler(b.rotation_mode)
+                    else:
+                        axis, angle = rot.to_axis_angle()
+                        value = (angle, *axis)
+                    prev[channel] = value
+                    values[row] = value
+        yield frames, samples
+
+#bake into action chunk by chunk, each chunk's keys are appended in bulk before the next one is
+#simulated, so memory is bounded by the chunk size. returns the data paths it keyed
+def bake_jiggle_action(scene, ob, bones, action, chunk=250):
+    curves = {}
+    for frames, samples in jiggle_bake_chunks(scene, ob, bones, chunk):
+        for b, sample in zip(bones, samples):
+            for channel, values in sample.items():
+                data_path = b.path_from_id(channel)
+                for i in range(values.shape[1]):
+                    if (data_path, i) not in curves:
+                        curves[data_path, i] = new_fcurve(action, data_path, i, b.name)
+                    append_keys(curves[data_path, i], frames, values[:,i])
+    for fc in curves.values():
+        fc.update()
+    return {data_path for data_path, i in curves}
+
+#settle jiggle before the first frame of a bake or export
+def prewarm_jiggle(scene):
+    if scene.jiggle_loop_seamless and not scene.jiggle_reset:
+        #steady state of the loop replaces the prewarm, the bake's first frame is seeded from it
+        bpy.ops.id.solve_wiggle_loop()
+    elif not scene.jiggle_reset:
+        #prewarm loop
+        for frame in range(scene.frame_start,scene.frame_end):
+            scene.frame_set(frame)
+            if frame == scene.frame_start:
+                reset_jiggle_tree(get_jiggle_tree(scene))
+
+######## TRANSFORM EXPORT ######################################################################
+#simulated local transforms of an armature's jiggle bones for tools outside blender, written from
+#the bulk pose arrays without going through f-curves. binary files are little endian:
+#   header  magic b'JGLT', version, frame count, bone count (uint32), first frame (int32),
+#           fps (float32), data offset (uint64)
+#   names   plan bone names as utf-8, one per line, zero padded up to the data offset
+#   data    float32 [frame, bone, 10] block at the data offset, 64 byte aligned for memory mapping.
+#           per bone the location xyz, rotation quaternion wxyz and scale xyz of its matrix_basis
+#.npz files hold the same block as 'transforms' next to 'names', 'frames' and 'fps'.
+transform_header = struct.Struct('<4sIIIifQ')
+transform_version = 1
+
+#rotation matrices to unit quaternions wxyz. the products 4*q[a]*q[b] of all components are sums and
+#differences of matrix entries, each quaternion is read from the row of its largest component
+def matrix_quaternions(r):
+    n = len(r)
+    p = np.empty((n,4,4))
+    diagonal = np.stack((r[:,0,0], r[:,1,1], r[:,2,2]), axis=1)
+    p[:,range(4),range(4)] = 1 + diagonal @ np.array([[1,1,1], [1,-1,-1], [-1,1,-1], [-1,-1,1]]).T
+    for a, b, value in ((0, 1, r[:,2,1] - r[:,1,2]), (0, 2, r[:,0,2] - r[:,2,0]), (0, 3, r[:,1,0] - r[:,0,1]),
+                        (1, 2, r[:,0,1] + r[:,1,0]), (1, 3, r[:,0,2] + r[:,2,0]), (2, 3, r[:,1,2] + r[:,2,1])):
+        p[:,a,b] = p[:,b,a] = value
+    i = np.argmax(p[:,range(4),range(4)], axis=1)
+    q = p[np.arange(n),i] / (2*np.sqrt(np.maximum(p[np.arange(n),i,i], 1e-12)))[:,None]
+    return q / np.linalg.norm(q, axis=1)[:,None]
+
+#flat matrix_basis values (column major) to rows of location, quaternion and scale
+def basis_transforms(basis):
+    m = basis.reshape(-1,4,4).transpose(0,2,1)
+    scale = np.linalg.norm(m[:,:3,:3], axis=1)
+    r = m[:,:3,:3] / np.maximum(scale, 1e-12)[:,None,:]
+    mirrored = np.linalg.det(r) < 0
+    scale[mirrored,0] *= -1
+    r[mirrored,:,0] *= -1
+    return np.concatenate((m[:,:3,3], matrix_quaternions(r), scale), axis=1).astype(np.float32)
+
+#one (bones, 10) array per frame of the range, quaternions kept in the hemisphere of the last frame
+def jiggle_transform_frames(scene, ob, plan, frame_start, frame_end):
+    last = None
+    for frame in range(frame_start, frame_end + 1):
+        scene.frame_set(frame)
+        transforms = basis_transforms(pose_bone_array(ob, 'matrix_basis', 16)[plan['indices']])
+        if last is not None:
+            transforms[np.sum(transforms[:,3:7] * last[:,3:7], axis=1) < 0, 3:7] *= -1
+        last = transforms
+        yield transforms
+
+#simulate the range and stream it to a binary file object frame by frame, or collect it for an .npz
+def write_jiggle_transforms(file, scene, ob, plan, frame_start, frame_end, npz=False):
+    count = frame_end - frame_start + 1
+    fps = scene.render.fps / scene.render.fps_base
+    frames = jiggle_transform_frames(scene, ob, plan, frame_start, frame_end)
+    if npz:
+        block = np.empty((count, len(plan['names']), 10), dtype=np.float32)
+        for i, transforms in enumerate(frames):
+            block[i] = transforms
+        np.savez(file, transforms=block, names=np.array(plan['names']),
+                 frames=np.arange(frame_start, frame_end + 1), fps=np.float32(fps))
+        return
+    names = '\n'.join(plan['names']).encode()
+    offset = -(-(transform_header.size + len(names)) // 64) * 64
+    file.write(transform_header.pack(b'JGLT', transform_version, count, len(plan['names']), frame_start, fps, offset))
+    file.write(names.ljust(offset - transform_header.size, b'\0'))
+    for transforms in frames:
+        file.write(transforms.data)
+
+#header and memory mapped [frame, bone, 10] block of a binary export, the layout importers rely on
+def read_jiggle_transforms(path):
+    with open(path, 'rb') as file:
+        head = file.read(transform_header.size)
+        magic, version, count, bones, frame_start, fps, offset = transform_header.unpack(head)
+        if magic != b'JGLT' or version != transform_version:
+            raise ValueError('%s is not a wiggle transform export' %path)
+        names = file.read(offset - transform_header.size).rstrip(b'\0').decode().split('\n')
+    block = np.memmap(path, dtype='<f4', mode='r', offset=offset, shape=(count, bones, 10))
+    return {'names': names, 'frame_start': frame_start, 'fps': fps, 'transforms': block}
+
 class bake_jiggle(bpy.types.Operator):
-    """Bake wiggle dynamics on selected bones"""
+    """Bake wiggle dynamics of the active armature's wiggle bones"""
     bl_idname = "id.bake_wiggle"
     bl_label = "Bake Wiggle"
     
@@ -917,6 +3007,33 @@ class bake_jiggle(bpy.types.Operator):
     
     def execute(self,context):
         ob = context.object
+        bones = jiggle_bake_bones(context.scene, ob)
+        if not bones:
+            self.report({'WARNING'}, 'No wiggle bones to bake on the active armature')
+            return {'CANCELLED'}
+        #parameters are prefetched before the current action moves to the nla in additive bakes
+        prefetch_jiggle_params(get_jiggle_tree(context.scene), context.scene.frame_start, context.scene.frame_end)
+        try:
+            self.bake(context, ob, bones)
+        finally:
+            param_tables.clear()
+        
+        #turn off dynamics according to bpy.context.scene.jiggle_disable_mask
+        mask = context.scene.jiggle_disable_mask
+        if mask == 'BONES':
+            for b in bones:
+                b.jiggle_enable = False
+        elif mask == 'ARMATURE':
+            context.object.data.jiggle_enable = False
+        elif mask == 'SCENE':
+            context.scene.jiggle_enable = False
+        else:
+            print("shouldn't get here")
+        bpy.context.area.type = "PROPERTIES"
+        return {'FINISHED'}
+    
+    #prewarm, bake and decimate into the armature's action
+    def bake(self, context, ob, bones):
         if context.scene.jiggle_bake_additive:
             if ob.animation_data:
                 if ob.animation_data.action:
@@ -925,35 +3042,61 @@ class bake_jiggle(bpy.types.Operator):
                     track.strips.new(action.name, action.frame_range[0], action)
                     ob.animation_data.action = None
             else:
-                ob.animation_data.create()
+                ob.animation_data_create()
                 ob.animation_data.use_nla = True
             ob.animation_data.action_blend_type = 'ADD'
         else:
             if ob.animation_data:
                 ob.animation_data.action_blend_type = 'REPLACE'
             
-        if not context.scene.jiggle_reset:
-            #prewarm loop
-            for frame in range(context.scene.frame_start,context.scene.frame_end):
-                context.scene.frame_set(frame)
-                if frame == context.scene.frame_start:
-                    bpy.ops.id.reset_wiggle()
+        prewarm_jiggle(context.scene)
                     
-        #bake bones - start to end, active bones, don't clear constraints
-        bpy.ops.nla.bake(frame_start = context.scene.frame_start, frame_end = context.scene.frame_end, visual_keying=True)
-        
-        #turn off dynamics according to bpy.context.scene.jiggle_disable_mask
-        mask = context.scene.jiggle_disable_mask
-        if mask == 'BONES':
-            for b in bpy.context.selected_pose_bones:
-                b.jiggle_enable = False
-        elif mask == 'ARMATURE':
-            context.object.data.jiggle_enable = False
-        elif mask == 'SCENE':
-            context.scene.jiggle_enable = False
+        #bake jiggle bones - start to end, jiggle channels only, don't clear constraints
+        #replace keeps the rest of the current action, additive bakes into a new one on top of the nla
+        current = ob.animation_data.action if ob.animation_data else None
+        if current and not context.scene.jiggle_bake_additive:
+            action = current.copy()
         else:
-            print("shouldn't get here")
-        bpy.context.area.type = "PROPERTIES"
+            action = bpy.data.actions.new(ob.name + 'Action')
+        data_paths = bake_jiggle_action(context.scene, ob, bones, action, context.scene.jiggle_bake_chunk)
+        ob.animation_data_create().action = action
+        if context.scene.jiggle_bake_decimate:
+            decimate_action(action, context.scene.jiggle_bake_angle_tolerance, context.scene.jiggle_bake_distance_tolerance, data_paths)
+    
+class export_jiggle(bpy.types.Operator):
+    """Export the simulated local transforms of the active armature's wiggle bones (.jgl binary or .npz)"""
+    bl_idname = "id.export_wiggle"
+    bl_label = "Export Wiggle Transforms"
+    
+    filepath: bpy.props.StringProperty(subtype='FILE_PATH')
+    filter_glob: bpy.props.StringProperty(default='*.jgl;*.npz', options={'HIDDEN'})
+    
+    @classmethod
+    def poll(cls, context):
+        return context.object and context.object.type == 'ARMATURE'
+    
+    def invoke(self, context, event):
+        if not self.filepath:
+            self.filepath = context.object.name + '.jgl'
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+    
+    def execute(self, context):
+        scene = context.scene
+        ob = context.object
+        plan = jiggle_armature_plan(scene, ob)
+        if not plan or not plan['names']:
+            self.report({'WARNING'}, 'No wiggle bones to export on the active armature')
+            return {'CANCELLED'}
+        path = bpy.path.abspath(self.filepath)
+        prefetch_jiggle_params(get_jiggle_tree(scene), scene.frame_start, scene.frame_end)
+        try:
+            prewarm_jiggle(scene)
+            with open(path, 'wb') as file:
+                write_jiggle_transforms(file, scene, ob, plan, scene.frame_start, scene.frame_end, path.lower().endswith('.npz'))
+        finally:
+            param_tables.clear()
+        self.report({'INFO'}, 'Exported %d frames of %d bones to %s' %(scene.frame_end - scene.frame_start + 1, len(plan['names']), path))
         return {'FINISHED'}
     
 class JiggleBonePanel(bpy.types.Panel):
@@ -994,11 +3137,10 @@ class JiggleBonePanel(bpy.types.Panel):
         col.prop(b, 'jiggle_translation')
         col.prop(b, 'jiggle_stretch')
         col.prop(b, 'jiggle_gravity')
-        col = col.column()
-        col.enabled = False
-        col.prop(b, 'jiggle_collision',text="Collisions disabled during beta.")
+        col.prop(b, 'jiggle_force')
+        col.prop(b, 'jiggle_collision')
         #col.enabled = b.jiggle_active
-        #col = col.column()
+        col = col.column()
         col.prop(b, 'jiggle_collision_margin')
         col.prop(b, 'jiggle_collision_friction')
         col.enabled = b.jiggle_collision
@@ -1011,7 +3153,14 @@ class JiggleBonePanel(bpy.types.Panel):
         col.separator()
         col.operator("id.select_wiggle")
         col.operator("id.bake_wiggle")
+        col.operator("id.export_wiggle")
         layout.prop(context.scene, 'jiggle_bake_additive')
+        layout.prop(context.scene, 'jiggle_bake_chunk')
+        layout.prop(context.scene, 'jiggle_bake_decimate')
+        col = layout.column()
+        col.prop(context.scene, 'jiggle_bake_angle_tolerance')
+        col.prop(context.scene, 'jiggle_bake_distance_tolerance')
+        col.enabled = context.scene.jiggle_bake_decimate
         layout.prop(context.scene,"jiggle_disable_mask",text="Bake disables wiggle:")
         
 class JiggleScenePanel(bpy.types.Panel):
@@ -1029,10 +3178,34 @@ class JiggleScenePanel(bpy.types.Panel):
        layout.use_property_split = True
        col = layout.column()
        col.prop(context.scene, 'jiggle_reset')
+       col = col.column()
+       col.prop(context.scene, 'jiggle_loop_seamless')
+       col.prop(context.scene, 'jiggle_loop_cycles')
+       col.prop(context.scene, 'jiggle_loop_tolerance')
+       col.operator('id.solve_wiggle_loop')
+       col.enabled = not context.scene.jiggle_reset
+       col = layout.column()
+       col.prop(context.scene, 'jiggle_catchup_frames')
+       col.prop(context.scene, 'jiggle_skip_idle')
+       col.prop(context.scene, 'jiggle_share_instances')
+       col.prop(context.scene, 'jiggle_frame_budget')
+       col.prop(context.scene, 'jiggle_use_force_fields')
+       col.prop(context.scene, 'jiggle_checkpoint_interval')
+       col.prop(context.scene, 'jiggle_checkpoint_max_gap')
+       col.prop(context.scene, 'jiggle_checkpoint_budget')
        col.prop(context.scene, 'jiggle_use_fps_scale')
        col = col.column()
        col.prop(context.scene, 'jiggle_base_fps')
        col.enabled = context.scene.jiggle_use_fps_scale
+       col = layout.column()
+       col.prop(context.scene, 'jiggle_solver')
+       col = col.column()
+       col.prop(context.scene, 'jiggle_integrator')
+       col.enabled = context.scene.jiggle_solver == 'BONE'
+       col = layout.column()
+       col.prop(context.scene, 'jiggle_chain_substeps')
+       col.prop(context.scene, 'jiggle_threads')
+       col.enabled = context.scene.jiggle_solver == 'CHAIN'
 #        layout.prop(context.scene, 'jiggle_enable')
 
 class JiggleArmaturePanel(bpy.types.Panel):
@@ -1052,6 +3225,8 @@ class JiggleArmaturePanel(bpy.types.Panel):
     def draw(self,context):
         c = context.object
         #layout = self.layout()
+        self.layout.prop(c.data, 'jiggle_priority')
+        self.layout.prop(c.data, 'jiggle_self_collision')
         
 class JiggleColliderPanel(bpy.types.Panel):
     bl_label = 'Wiggle Collider'
@@ -1062,7 +3237,7 @@ class JiggleColliderPanel(bpy.types.Panel):
     
     @classmethod
     def poll(cls, context):
-        return (context.object is not None and context.object.type == 'EMPTY')
+        return (context.object is not None and context.object.type in ('EMPTY', 'MESH'))
     
     def draw_header(self,context):
         self.layout.prop(context.object, 'jiggle_collider_enable', text="")
@@ -1071,6 +3246,12 @@ class JiggleColliderPanel(bpy.types.Panel):
         #layout = self.layout
         c = context.object
         #layout.prop(c, 'jiggle_collider_enable')
+        if c.type == 'MESH':
+            col = self.layout.column()
+            col.enabled = c.jiggle_collider_enable
+            col.prop(c, 'jiggle_collider_type')
+            if c.jiggle_collider_type == 'SDF':
+                col.prop(c, 'jiggle_sdf_resolution')
         
 class jiggle_bone_item(bpy.types.PropertyGroup):
     name: bpy.props.StringProperty()
@@ -1091,12 +3272,18 @@ def register():
     bpy.utils.register_class(bake_jiggle)
     bpy.utils.register_class(reset_wiggle)
     bpy.utils.register_class(select_wiggle_bones)
+    bpy.utils.register_class(solve_wiggle_loop)
+    bpy.utils.register_class(export_jiggle)
     
     bpy.types.PoseBone.jiggle_spring = bpy.props.FloatVectorProperty(default=Vector((0,0,0)))
     bpy.types.PoseBone.jiggle_velocity = bpy.props.FloatVectorProperty(default=Vector((0,0,0)))
     
     bpy.types.PoseBone.jiggle_spring2 = bpy.props.FloatVectorProperty(default=Vector((0,0,0)))
     bpy.types.PoseBone.jiggle_velocity2 = bpy.props.FloatVectorProperty(default=Vector((0,0,0)))
+    #previous frame world matrices of the per bone solver, registered so states are read and written in bulk
+    bpy.types.PoseBone.jiggle_last_mat = bpy.props.FloatVectorProperty(size=16, subtype='MATRIX', options={'HIDDEN'})
+    bpy.types.PoseBone.jiggle_last_anim = bpy.props.FloatVectorProperty(size=16, subtype='MATRIX', options={'HIDDEN'})
+    bpy.types.PoseBone.jiggle_last_rot = bpy.props.FloatVectorProperty(size=4, subtype='QUATERNION', default=(1,0,0,0), options={'HIDDEN'})
     
     bpy.types.Scene.jiggle_enable = bpy.props.BoolProperty(
         name = 'Enabled:',
@@ -1109,6 +3296,69 @@ def register():
         description = 'Jiggle physics reset when looping playback',
         default = True
     )
+    bpy.types.Scene.jiggle_loop_seamless = bpy.props.BoolProperty(
+        name = 'Seamless Loop',
+        description = 'Start the loop from its solved steady state instead of resetting or prewarming',
+        default = False
+    )
+    bpy.types.Scene.jiggle_loop_cycles = bpy.props.IntProperty(
+        name = 'Max Loop Cycles',
+        description = 'Maximum number of times the range is simulated while solving the loop',
+        default = 10,
+        min = 2
+    )
+    bpy.types.Scene.jiggle_loop_tolerance = bpy.props.FloatProperty(
+        name = 'Loop Tolerance',
+        description = 'The loop is settled once spring state changes less than this between cycles',
+        default = 0.0001,
+        min = 0,
+        precision = 5
+    )
+    bpy.types.Scene.jiggle_catchup_frames = bpy.props.IntProperty(
+        name = 'Catch Up Frames',
+        description = 'Dropped playback frames that are integrated instead of resetting jiggle, 0 always resets',
+        default = 60,
+        min = 0
+    )
+    bpy.types.Scene.jiggle_checkpoint_interval = bpy.props.IntProperty(
+        name = 'Checkpoint Interval',
+        description = 'Frames between cached jiggle states used to resimulate while scrubbing, 0 resets when scrubbing',
+        default = 10,
+        min = 0
+    )
+    bpy.types.Scene.jiggle_checkpoint_max_gap = bpy.props.IntProperty(
+        name = 'Max Resimulation',
+        description = 'Most frames resimulated from a checkpoint when scrubbing, farther jumps reset at rest',
+        default = 100,
+        min = 0
+    )
+    bpy.types.Scene.jiggle_checkpoint_budget = bpy.props.FloatProperty(
+        name = 'Checkpoint Memory (MB)',
+        description = 'Memory budget of the checkpoint cache, least recently used checkpoints are dropped first',
+        default = 64.0,
+        min = 0.0
+    )
+    bpy.types.Scene.jiggle_skip_idle = bpy.props.BoolProperty(
+        name = 'Skip Idle Armatures',
+        description = 'Armatures that are settled and not animated or moved keep their pose without solving',
+        default = True
+    )
+    bpy.types.Scene.jiggle_share_instances = bpy.props.BoolProperty(
+        name = 'Share Instance Solves',
+        description = 'Armatures with identical animation, parameters and motion, offset only in location, are solved once',
+        default = True
+    )
+    bpy.types.Scene.jiggle_frame_budget = bpy.props.FloatProperty(
+        name = 'Frame Budget (ms)',
+        description = 'Jiggle solve time per frame during viewport playback, over it quality degrades until it fits. 0 always solves at full quality',
+        default = 0.0,
+        min = 0.0
+    )
+    bpy.types.Scene.jiggle_use_force_fields = bpy.props.BoolProperty(
+        name = 'Force Fields',
+        description = 'Wind, force, vortex and turbulence field objects of the scene push jiggle bones',
+        default = False
+    )
     bpy.types.Scene.jiggle_use_fps_scale = bpy.props.BoolProperty(
         name = 'Frame Rate Scaling',
         description = 'Physics rate scales to match frame rate',
@@ -1121,6 +3371,40 @@ def register():
     )
     bpy.types.Scene.jiggle_rate = bpy.props.FloatProperty(name='Rate',default=1.0)
     
+    solver_enum = [
+        ('BONE','Per Bone','Each bone is an independent angular spring'),
+        ('CHAIN','Chain','Position based solve of whole bone chains, uses stiffness, dampening and gravity')
+    ]
+    bpy.types.Scene.jiggle_solver = bpy.props.EnumProperty(
+        items = solver_enum,
+        name = 'Solver',
+        default = 'BONE',
+        description = 'Jiggle solver used for all armatures'
+    )
+    integrator_enum = [
+        ('EULER','Per Frame','One explicit spring step per frame, the original behavior'),
+        ('ANALYTIC','Analytic','Exact damped spring solution over the frame time, consistent across frame rates and skipped frames')
+    ]
+    bpy.types.Scene.jiggle_integrator = bpy.props.EnumProperty(
+        items = integrator_enum,
+        name = 'Integrator',
+        default = 'EULER',
+        description = 'Spring integration of the per bone solver, use with Frame Rate Scaling for frame rate independent motion'
+    )
+    bpy.types.Scene.jiggle_threads = bpy.props.IntProperty(
+        name = 'Chain Threads',
+        description = 'Chain solver only, worker threads stepping the chains of different armatures in parallel, 0 uses all cores, 1 solves on the main thread. The per bone solver always runs on the main thread',
+        default = 0,
+        min = 0
+    )
+    bpy.types.Scene.jiggle_chain_substeps = bpy.props.IntProperty(
+        name = 'Chain Substeps',
+        description = 'Chain solver steps per frame, higher values are more stable on long chains',
+        default = 1,
+        min = 1,
+        max = 16
+    )
+    
     mask_enum = [
         ('SCENE','Scene','scene mask'),
         ('ARMATURE','Armature', 'armature mask'),
@@ -1133,6 +3417,42 @@ def register():
         description = 'Push any current action to NLA and create additive jiggle on top',
         default = True
     )
+    bpy.types.Scene.jiggle_bake_chunk = bpy.props.IntProperty(
+        name = 'Bake Chunk',
+        description = 'Frames the bake simulates before writing their keys, bounds memory on long shots',
+        default = 250,
+        min = 1
+    )
+    bpy.types.Scene.jiggle_bake_decimate = bpy.props.BoolProperty(
+        name = 'Decimate Bake',
+        description = 'Reduce baked keys to the fewest linear keys within the tolerances, drop channels that never move',
+        default = True
+    )
+    bpy.types.Scene.jiggle_bake_angle_tolerance = bpy.props.FloatProperty(
+        name = 'Angle Tolerance',
+        description = 'Largest rotation error of decimated keys',
+        subtype = 'ANGLE',
+        default = math.radians(0.1),
+        min = 0
+    )
+    bpy.types.Scene.jiggle_bake_distance_tolerance = bpy.props.FloatProperty(
+        name = 'Distance Tolerance',
+        description = 'Largest location and scale error of decimated keys',
+        subtype = 'DISTANCE',
+        default = 0.0001,
+        min = 0,
+        precision = 5
+    )
+    bpy.types.Armature.jiggle_priority = bpy.props.IntProperty(
+        name = 'Playback Priority',
+        description = 'Armatures with lower priority are the first to reuse their last jiggle when playback is over the frame budget',
+        default = 0
+    )
+    bpy.types.Armature.jiggle_self_collision = bpy.props.BoolProperty(
+        name = 'Self Collision',
+        description = 'Bones of different chains push each other apart, radius from their collision tip margin. Chain solver only',
+        default = False
+    )
     bpy.types.Armature.jiggle_enable = bpy.props.BoolProperty(
         name = 'Enabled:',
         description = 'Toggle Dynamic jiggle bones on this armature',
@@ -1149,6 +3469,23 @@ def register():
         default = False,
         update = jiggle_list_refresh_ui
     )
+    collider_enum = [
+        ('SURFACE','Deforming','Collide with the evaluated mesh, rebuilt every frame it deforms'),
+        ('SDF','Static','Voxelize the mesh once into a signed distance grid, for static environment geometry')
+    ]
+    bpy.types.Object.jiggle_collider_type = bpy.props.EnumProperty(
+        items = collider_enum,
+        name = 'Collider Type',
+        default = 'SURFACE',
+        description = 'How a mesh collider is represented'
+    )
+    bpy.types.Object.jiggle_sdf_resolution = bpy.props.IntProperty(
+        name = 'Grid Resolution',
+        description = 'Voxels along the longest side of the signed distance grid',
+        default = 64,
+        min = 8,
+        max = 256
+    )
     bpy.types.PoseBone.jiggle_enable = bpy.props.BoolProperty(
         name = 'Enabled',
         description = 'Enable jiggle on this bone',
@@ -1191,6 +3528,12 @@ def register():
         default = 0.5,
         update = gravity_update
     )
+    bpy.types.PoseBone.jiggle_force = bpy.props.FloatProperty(
+        name = 'Force Fields:',
+        description = 'response to wind, force, vortex and turbulence fields',
+        default = 1.0,
+        update = force_update
+    )
     bpy.types.PoseBone.jiggle_translation = bpy.props.FloatProperty(
         name = 'Amplitude Translation:',
         description = 'strength of translation for disconnected bones',
@@ -1225,8 +3568,14 @@ def register():
     bpy.app.handlers.frame_change_post.append(jiggle_post)
     bpy.app.handlers.render_pre.append(jiggle_render)
     bpy.app.handlers.render_post.append(render_post)
+    bpy.app.handlers.depsgraph_update_post.append(jiggle_depsgraph_update)
+    bpy.app.handlers.load_post.append(jiggle_load_post)
 
 def unregister():
+    global chain_pool
+    if chain_pool:
+        chain_pool.shutdown()
+        chain_pool = None
     bpy.utils.unregister_class(JiggleBonePanel)
     bpy.utils.unregister_class(JiggleScenePanel)
     bpy.utils.unregister_class(JiggleArmaturePanel)
@@ -1237,11 +3586,15 @@ def unregister():
     bpy.utils.unregister_class(bake_jiggle)
     bpy.utils.unregister_class(select_wiggle_bones)
     bpy.utils.unregister_class(reset_wiggle)
+    bpy.utils.unregister_class(solve_wiggle_loop)
+    bpy.utils.unregister_class(export_jiggle)
     
     bpy.app.handlers.frame_change_pre.remove(jiggle_pre)
     bpy.app.handlers.frame_change_post.remove(jiggle_post)
     bpy.app.handlers.render_pre.remove(jiggle_render)
     bpy.app.handlers.render_post.remove(render_post)
+    bpy.app.handlers.depsgraph_update_post.remove(jiggle_depsgraph_update)
+    bpy.app.handlers.load_post.remove(jiggle_load_post)
 
 if __name__ == "__main__":
     register()
@@ -1274,6 +3627,34 @@ if __name__ == "__main__":
 #post bake disabling shouldn't mess up bone enabled states anymore
 #additive is optional when baking wiggle
 
+#1.6 CHANGELOG
+
+#feature: chain solver mode, solves whole bone chains as verlet particles in one vectorized step
+#optimization: parent offsets are cached for bones that aren't animated or constrained
+#optimization: rest pose restoration is one bulk read and write per channel, skipped when the bones are already at rest
+#optimization: jiggle is solved once per scene and frame, other view layers and scenes sharing the armature reuse it
+#feature: seamless loop, solves the steady state of a looping range once instead of prewarming
+#feature: dropped playback frames are caught up instead of resetting jiggle
+#feature: scrubbing resimulates from cached checkpoints, bounded by a memory budget
+#optimization: settled armatures without animation or movement are skipped
+#optimization: armatures store a compact jiggle topology, plans compile from it on file load
+#tools: jiggle_parity.py records reference solver output on canned rigs and checks other engines against it
+#feature: analytic spring integrator, exact over any frame time so motion matches across frame rates
+#feature: baked actions are decimated to error bounded linear keys, static channels are dropped
+#optimization: bake keys only the jiggle bones of the armature and only the channels their jiggle changes
+#optimization: instances with identical animation, parameters and motion share one solve
+#optimization: chain solver steps the armatures on a thread pool, blender data stays on the main thread
+#feature: playback frame budget, degrades substeps then defers low priority armatures to keep up
+#feature: wind, force, vortex and turbulence fields with a per bone response
+#feature: collisions are back, mesh colliders use bvh trees of the deformed mesh rebuilt when its geometry changes, empties are spheres
+#feature: static mesh colliders as signed distance grids, saved next to the .blend and memory mapped
+#feature: self collision between chains of an armature through a spatial hash (chain solver)
+#optimization: bakes and loop solves prefetch animated jiggle parameters over their range, solvers index them by frame
+#optimization: bakes stream chunks of frames into the action, memory no longer grows with the shot length
+#feature: export of the simulated local transforms of jiggle bones as a memory mappable binary block or .npz
+#optimization: jiggle tree build and traversal are iterative and linear, no recursion limit on long chains
+#optimization: reset is one bulk pass and one scene evaluation instead of an evaluation per bone, state can be seeded from snapshots
+
 #TODO
 
 #   -jiggle_tree needs to be a better stored variable